@@ -3,7 +3,12 @@ __all__ = [
     "ConditionOccurrence","DrugExposure","ProcedureOccurrence",
     "Measurement","VisitOccurrence","DateEvent",
     "Demographics","CohortCriteria",
-    "AND","OR","BEFORE","NOT"
+    "AND","OR","BEFORE","NOT",
+    "StatisticsCatalog","CardinalityEstimator",
+    "import_atlas_cohort","import_atlas_directory",
+    "compile_cohort","compile_cohorts","plan_cohorts",
+    "shard_cohort","run_sharded",
+    "TimelineStore","SampledExtract",
 ]
 
 def __getattr__(name):
@@ -30,4 +35,40 @@ def __getattr__(name):
         from . import logic as _logic
         return getattr(_logic, name)
 
+    # stats.py (needs duckdb only when building a catalog)
+    if name in {"StatisticsCatalog","CardinalityEstimator"}:
+        from . import stats as _stats
+        return getattr(_stats, name)
+
+    # atlas.py
+    if name in {"import_atlas_cohort","import_atlas_directory"}:
+        from . import atlas as _atlas
+        return getattr(_atlas, name)
+
+    # sql.py / planner.py
+    if name == "compile_cohort":
+        from .sql import compile_cohort as _compile_cohort
+        return _compile_cohort
+    if name == "compile_cohorts":
+        from .sql import compile_cohorts as _compile_cohorts
+        return _compile_cohorts
+    if name == "plan_cohorts":
+        from .planner import plan_cohorts as _plan_cohorts
+        return _plan_cohorts
+
+    # sharding.py
+    if name in {"shard_cohort","run_sharded"}:
+        from . import sharding as _sharding
+        return getattr(_sharding, name)
+
+    # timeline.py (needs numpy)
+    if name == "TimelineStore":
+        from .timeline import TimelineStore as _TimelineStore
+        return _TimelineStore
+
+    # preview.py
+    if name == "SampledExtract":
+        from .preview import SampledExtract as _SampledExtract
+        return _SampledExtract
+
     raise AttributeError(f"module 'BiasAnalyzerYAMLBuilder' has no attribute '{name}'")
@@ -0,0 +1,8 @@
+# __main__.py
+"""`python -m CohortDefinition ...` -> CohortDefinition.cli.main()."""
+import sys
+
+from CohortDefinition.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,572 @@
+# atlas.py
+"""
+Import OHDSI ATLAS cohort-definition JSON into CohortCriteria.
+
+Mapping (everything else is reported, never raised):
+- ConceptSets          -> one event per included concept, ORed together
+                          (includeDescendants / includeMapped are reported as lossy)
+- PrimaryCriteria      -> the index expression; CriteriaList entries are ORed
+- AdditionalCriteria   -> one more temporal group, like an inclusion rule
+- InclusionRules       -> one temporal group per rule (ALL -> AND, ANY -> OR)
+- Criteria types       -> ConditionOccurrence / DrugExposure / ProcedureOccurrence /
+                          Measurement / VisitOccurrence
+- First: true          -> event_instance=1
+- OccurrenceStartDate  -> BEFORE against a DateEvent
+- Occurrence           -> "at least N" -> event_instance=N; "exactly 0" -> NOT
+- StartWindow          -> BEFORE(event, index) or BEFORE(index, event), with
+                          `interval` [min_days, max_days] when both bounds are finite
+- Gender (demographic) -> Demographics.gender
+
+Accepted inputs: a bare cohort expression, a WebAPI definition
+({"name": ..., "expression": {...} or "<json string>"}), or a JSON array of
+definitions. Arrays are streamed element by element, so very large bulk
+exports never have to fit in memory at once.
+
+    for result in import_atlas_directory("atlas_exports/", max_workers=8):
+        if result.criteria is not None:
+            result.criteria.save(f"yaml/{result.name}.yaml")
+        report.append(result.to_dict())
+"""
+
+import copy
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from CohortDefinition.builder import CohortCriteria, Demographics, FlowList
+from CohortDefinition.events import (
+    ConditionOccurrence,
+    DateEvent,
+    DrugExposure,
+    Event,
+    Measurement,
+    ProcedureOccurrence,
+    VisitOccurrence,
+)
+from CohortDefinition.logic import AND, BEFORE, NOT, OR, Operand
+
+# ATLAS criteria type -> builder event class
+ATLAS_EVENT_TYPES: Dict[str, type] = {
+    "ConditionOccurrence": ConditionOccurrence,
+    "DrugExposure": DrugExposure,
+    "ProcedureOccurrence": ProcedureOccurrence,
+    "Measurement": Measurement,
+    "VisitOccurrence": VisitOccurrence,
+}
+
+# ATLAS gender concept -> Demographics.gender
+_ATLAS_GENDERS: Dict[int, str] = {8507: "male", 8532: "female"}
+
+# Criterion attributes the importer understands
+_HANDLED_CRITERION_KEYS = {"CodesetId", "First", "OccurrenceStartDate", "CorrelatedCriteria"}
+
+# Top-level keys that only affect cohort era / exit, not membership (reported as lossy).
+# Metadata (Title, cdmVersionRange) and ExpressionLimit, which only picks an included
+# person's index event, never affect membership and are ignored silently.
+_ERA_TOP_LEVEL_KEYS = {"EndStrategy", "CensoringCriteria", "CollapseSettings", "CensorWindow"}
+
+
+# ---------- Report ----------
+@dataclass
+class ImportIssue:
+    """One piece of ATLAS logic that was dropped ("unmapped") or approximated ("lossy")."""
+    path: str
+    kind: str
+    message: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"path": self.path, "kind": self.kind, "message": self.message}
+
+
+@dataclass
+class AtlasImportResult:
+    """Outcome of importing one ATLAS cohort definition."""
+    name: str
+    source: Optional[str] = None
+    criteria: Optional[CohortCriteria] = None
+    issues: List[ImportIssue] = field(default_factory=list)
+    error: Optional[str] = None  # set when the definition could not be imported at all
+
+    @property
+    def ok(self) -> bool:
+        """True when the definition was imported without any dropped or approximated logic."""
+        return self.criteria is not None and self.error is None and not self.issues
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Report entry (JSON-ready); the cohort itself is included as its dict form."""
+        return {
+            "name": self.name,
+            "source": self.source,
+            "ok": self.ok,
+            "error": self.error,
+            "issues": [i.to_dict() for i in self.issues],
+            "cohort": self.criteria.to_dict() if self.criteria is not None else None,
+        }
+
+
+# ---------- Helpers ----------
+def _fold(fn: Callable[[Operand, Operand], Any], items: List[Operand]) -> Optional[Operand]:
+    """
+    Fold a list into a balanced tree of binary operators: [a, b, c, d] ->
+    fn(fn(a, b), fn(c, d)). Depth stays logarithmic, so large concept sets do not
+    hit the recursion limit when the cohort is serialized or pickled.
+    """
+    if not items:
+        return None
+    if len(items) == 1:
+        return items[0]
+    mid = len(items) // 2
+    return fn(_fold(fn, items[:mid]), _fold(fn, items[mid:]))
+
+
+def _window_bound(bound: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Signed day offset of a window bound relative to index (None = unbounded)."""
+    if not bound or bound.get("Days") is None:
+        return None
+    return int(bound["Days"]) * int(bound.get("Coeff", 1))
+
+
+class _Importer:
+    """Stateful translation of one ATLAS expression; collects issues as it goes."""
+
+    def __init__(self, expression: Dict[str, Any]):
+        self.expr = expression
+        self.issues: List[ImportIssue] = []
+        self.concept_sets: Dict[int, List[int]] = {}
+        self._concept_set_notes: Dict[int, List[Tuple[str, str]]] = {}
+        self._reported_sets = set()
+        self.demographics = Demographics()
+
+    def issue(self, path: str, kind: str, message: str) -> None:
+        self.issues.append(ImportIssue(path, kind, message))
+
+    # ----------------- Concept sets -----------------
+    def load_concept_sets(self) -> None:
+        for i, cs in enumerate(self.expr.get("ConceptSets") or []):
+            cs_id = cs.get("id", i)
+            ids: List[int] = []
+            notes: List[Tuple[str, str]] = []
+            for item in (cs.get("expression") or {}).get("items") or []:
+                cid = (item.get("concept") or {}).get("CONCEPT_ID")
+                if cid is None:
+                    continue
+                if item.get("isExcluded"):
+                    notes.append(("unmapped", f"excluded concept {cid} dropped"))
+                    continue
+                if item.get("includeDescendants"):
+                    notes.append(("lossy", f"descendants of concept {cid} not expanded"))
+                if item.get("includeMapped"):
+                    notes.append(("lossy", f"mapped concepts of {cid} not expanded"))
+                ids.append(int(cid))
+            self.concept_sets[int(cs_id)] = ids
+            self._concept_set_notes[int(cs_id)] = notes
+
+    def _concepts(self, codeset_id: Any, path: str) -> Optional[List[Optional[int]]]:
+        """Concept ids for a CodesetId ([None] means "any concept"); None if unusable."""
+        if codeset_id is None:
+            return [None]
+        cs_id = int(codeset_id)
+        if cs_id not in self.concept_sets:
+            self.issue(path, "unmapped", f"concept set {cs_id} is not defined")
+            return None
+        if cs_id not in self._reported_sets:
+            self._reported_sets.add(cs_id)
+            for kind, msg in self._concept_set_notes.get(cs_id, []):
+                self.issue(f"ConceptSets[{cs_id}]", kind, msg)
+        ids = self.concept_sets[cs_id]
+        if not ids:
+            self.issue(path, "unmapped", f"concept set {cs_id} has no usable concepts")
+            return None
+        return list(ids)
+
+    # ----------------- Criteria -----------------
+    def criterion(self, wrapper: Dict[str, Any], path: str,
+                  event_instance: Optional[int] = None, all_path: bool = True) -> Optional[Operand]:
+        """
+        Map one {"<Type>": {...}} criterion to an operand. `all_path` is False when
+        the criterion is not required for membership (under an ANY group or a NOT).
+        """
+        if not isinstance(wrapper, dict) or len(wrapper) != 1:
+            self.issue(path, "unmapped", "criterion must have exactly one type key")
+            return None
+        (ctype, body), = wrapper.items()
+        body = body or {}
+        path = f"{path}.{ctype}"
+        cls = ATLAS_EVENT_TYPES.get(ctype)
+        if cls is None:
+            self.issue(path, "unmapped", f"criteria type {ctype!r} has no builder event")
+            return None
+        for key, value in body.items():
+            if key not in _HANDLED_CRITERION_KEYS and value not in (None, False, [], {}):
+                self.issue(f"{path}.{key}", "unmapped", f"attribute {key!r} ignored")
+
+        concepts = self._concepts(body.get("CodesetId"), path)
+        if concepts is None:
+            return None
+        instance = event_instance
+        if body.get("First") and instance is None:
+            instance = 1
+        events: List[Operand] = []
+        for cid in concepts:
+            ev: Event = cls(event_concept_id=cid) if cid is not None else cls()
+            if instance is not None:
+                ev.event_instance = instance
+            events.append(ev)
+        operand = _fold(OR, events)
+
+        date_filter = body.get("OccurrenceStartDate")
+        if date_filter:
+            operand = self._date_filter(operand, date_filter, f"{path}.OccurrenceStartDate")
+
+        correlated = body.get("CorrelatedCriteria")
+        if correlated:
+            group = self.group(correlated, f"{path}.CorrelatedCriteria", index=operand, all_path=all_path)
+            if group is not None:
+                operand = AND(operand, group)
+        return operand
+
+    def _date_filter(self, operand: Operand, flt: Dict[str, Any], path: str) -> Operand:
+        op = str(flt.get("Op", "")).lower()
+        value, extent = flt.get("Value"), flt.get("Extent")
+        if op in ("gt", "gte") and value:
+            return BEFORE(DateEvent(str(value)), operand)
+        if op in ("lt", "lte") and value:
+            return BEFORE(operand, DateEvent(str(value)))
+        if op == "bt" and value and extent:
+            return AND(BEFORE(DateEvent(str(value)), operand), BEFORE(operand, DateEvent(str(extent))))
+        self.issue(path, "unmapped", f"date filter {flt!r} ignored")
+        return operand
+
+    def correlated(self, item: Dict[str, Any], path: str, index: Optional[Operand],
+                   all_path: bool = True) -> Optional[Operand]:
+        """Map a correlated criterion (Criteria + StartWindow + Occurrence)."""
+        occ = item.get("Occurrence") or {"Type": 2, "Count": 1}
+        occ_type, count = int(occ.get("Type", 2)), int(occ.get("Count", 1))
+        negate = False
+        instance: Optional[int] = None
+        if count == 0 and occ_type in (0, 1):  # exactly 0 / at most 0
+            negate = True
+        elif occ_type == 2:  # at least N
+            instance = count if count > 1 else None
+        elif occ_type == 0:  # exactly N
+            instance = count if count > 1 else None
+            self.issue(f"{path}.Occurrence", "lossy", f"'exactly {count}' mapped as 'at least {count}'")
+        else:
+            self.issue(f"{path}.Occurrence", "unmapped", f"'at most {count}' cannot be expressed")
+            return None
+        if occ.get("IsDistinct"):
+            self.issue(f"{path}.Occurrence", "lossy", "distinct counting ignored")
+
+        ev = self.criterion(item.get("Criteria") or {}, f"{path}.Criteria", event_instance=instance,
+                            all_path=all_path and not negate)
+        if ev is None:
+            return None
+        operand = self._window(ev, item, path, index)
+        return NOT(operand) if negate else operand
+
+    def _window(self, ev: Operand, item: Dict[str, Any], path: str, index: Optional[Operand]) -> Operand:
+        for key in ("EndWindow",):
+            if item.get(key):
+                self.issue(f"{path}.{key}", "lossy", "end window ignored")
+        for key in ("RestrictVisit", "IgnoreObservationPeriod"):
+            if item.get(key):
+                self.issue(f"{path}.{key}", "lossy", f"{key} ignored")
+        win = item.get("StartWindow")
+        if not win:
+            return ev
+        if win.get("UseEventEnd") or win.get("UseIndexEnd"):
+            self.issue(f"{path}.StartWindow", "lossy", "event/index end dates treated as start dates")
+        start, end = _window_bound(win.get("Start")), _window_bound(win.get("End"))
+        start_coeff = int((win.get("Start") or {}).get("Coeff", -1))
+        end_coeff = int((win.get("End") or {}).get("Coeff", 1))
+        if start is None and end is None and start_coeff < 0 < end_coeff:
+            return ev  # all time: plain co-occurrence
+        if index is None:
+            self.issue(f"{path}.StartWindow", "unmapped", "window has no index event to anchor to")
+            return ev
+        index = copy.deepcopy(index)  # fresh copy per use: no YAML anchors/aliases in the output
+        same_day = "same-day events excluded: a window bound of 0 days mapped to a strict BEFORE"
+        if end is not None and end <= 0:  # event entirely on/before index
+            if end == 0:
+                self.issue(f"{path}.StartWindow", "lossy", same_day)
+            if start is not None:
+                return _interval(BEFORE(ev, index), -end, -start)
+            if end < 0:
+                self.issue(f"{path}.StartWindow", "lossy", f"minimum gap of {-end} days dropped")
+            return BEFORE(ev, index)
+        if start is not None and start >= 0:  # event entirely on/after index
+            if start == 0:
+                self.issue(f"{path}.StartWindow", "lossy", same_day)
+            if end is not None:
+                return _interval(BEFORE(index, ev), start, end)
+            if start > 0:
+                self.issue(f"{path}.StartWindow", "lossy", f"minimum gap of {start} days dropped")
+            return BEFORE(index, ev)
+        self.issue(f"{path}.StartWindow", "lossy", "window spans the index date; mapped as co-occurrence")
+        return ev
+
+    # ----------------- Groups -----------------
+    def group(self, grp: Dict[str, Any], path: str, index: Optional[Operand],
+              all_path: bool = True) -> Optional[Operand]:
+        """
+        Map a CriteriaGroup (ALL / ANY) to an operand. `all_path` is True when every
+        enclosing group is ALL, i.e. the group is required for membership.
+        """
+        gtype = str(grp.get("Type", "ALL")).upper()
+        count = grp.get("Count")
+        if gtype == "AT_LEAST" and count is not None and int(count) <= 1:
+            gtype = "ANY"
+        if gtype not in ("ALL", "ANY"):
+            self.issue(path, "unmapped", f"group type {gtype} (count={count}) cannot be expressed")
+            return None
+        required = all_path and gtype == "ALL"
+        items: List[Operand] = []
+        for i, item in enumerate(grp.get("CriteriaList") or []):
+            op = self.correlated(item, f"{path}.CriteriaList[{i}]", index, all_path=required)
+            if op is not None:
+                items.append(op)
+        for i, demo in enumerate(grp.get("DemographicCriteriaList") or []):
+            self.demographic(demo, f"{path}.DemographicCriteriaList[{i}]", in_all_group=required)
+        for i, sub in enumerate(grp.get("Groups") or []):
+            op = self.group(sub, f"{path}.Groups[{i}]", index, all_path=required)
+            if op is not None:
+                items.append(op)
+        return _fold(AND if gtype == "ALL" else OR, items)
+
+    def demographic(self, demo: Dict[str, Any], path: str, in_all_group: bool = True) -> None:
+        for key, value in demo.items():
+            if value in (None, [], {}):
+                continue
+            if key != "Gender":
+                self.issue(f"{path}.{key}", "unmapped", f"demographic criterion {key!r} ignored")
+                continue
+            genders = {_ATLAS_GENDERS.get(int(c.get("CONCEPT_ID", -1))) for c in value}
+            if None in genders:
+                self.issue(f"{path}.Gender", "unmapped", "only male/female gender concepts are supported")
+                continue
+            if len(genders) != 1:
+                continue  # both genders: no restriction
+            if not in_all_group:
+                self.issue(f"{path}.Gender", "unmapped",
+                           "gender inside an ANY group (or a negated criterion) cannot be expressed")
+                continue
+            gender = genders.pop()
+            if self.demographics.gender and self.demographics.gender != gender:
+                self.issue(f"{path}.Gender", "unmapped", f"conflicting gender {gender!r} ignored")
+                continue
+            self.demographics.gender = gender
+
+    # ----------------- Whole expression -----------------
+    def run(self) -> CohortCriteria:
+        expr = self.expr
+        if "PrimaryCriteria" not in expr:
+            raise ValueError("not an ATLAS cohort expression (missing PrimaryCriteria)")
+        for key in sorted(_ERA_TOP_LEVEL_KEYS & set(expr)):
+            if expr[key] not in (None, [], {}):
+                self.issue(key, "lossy", "cohort era / exit settings do not affect membership; ignored")
+        limit = str((expr.get("QualifiedLimit") or {}).get("Type", "All")).upper()
+        if limit != "ALL" and expr.get("InclusionRules"):
+            self.issue("QualifiedLimit", "lossy",
+                       f"qualified event limit {limit.title()!r} not applied; inclusion rules may match any event")
+        self.load_concept_sets()
+
+        primary = expr.get("PrimaryCriteria") or {}
+        window = primary.get("ObservationWindow") or {}
+        if window.get("PriorDays") or window.get("PostDays"):
+            self.issue("PrimaryCriteria.ObservationWindow", "lossy", "observation window ignored")
+        entries = []
+        primary_list = primary.get("CriteriaList") or []
+        for i, wrapper in enumerate(primary_list):
+            # Several primary criteria are alternatives, so none of them is required
+            op = self.criterion(wrapper, f"PrimaryCriteria.CriteriaList[{i}]", all_path=len(primary_list) == 1)
+            if op is not None:
+                entries.append(op)
+        index = _fold(OR, entries)
+        if index is None:
+            raise ValueError("no primary criteria could be mapped")
+
+        blocks: List[Operand] = [index]
+        additional = expr.get("AdditionalCriteria")
+        if additional:
+            op = self.group(additional, "AdditionalCriteria", index)
+            if op is not None:
+                blocks.append(op)
+        for i, rule in enumerate(expr.get("InclusionRules") or []):
+            op = self.group(rule.get("expression") or {}, f"InclusionRules[{i}]", index)
+            if op is not None:
+                blocks.append(op)
+
+        demo = self.demographics
+        has_demo = any(v is not None for v in (demo.gender, demo.min_birth_year, demo.max_birth_year))
+        return CohortCriteria(temporal_blocks=blocks, demographics=demo if has_demo else None)
+
+
+def _interval(block: Dict[str, Any], lo: int, hi: int) -> Dict[str, Any]:
+    """Attach an [lo, hi] day interval to a BEFORE block."""
+    return {**block, "interval": FlowList([int(lo), int(hi)])}
+
+
+# ---------- Reading ----------
+def _unwrap(definition: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Return (name, expression) for a bare expression or a WebAPI definition."""
+    if not isinstance(definition, dict):
+        raise ValueError(f"expected a JSON object, got {type(definition).__name__}")
+    if "expression" in definition:
+        expr = definition["expression"]
+        if isinstance(expr, str):
+            expr = json.loads(expr)
+        return definition.get("name"), expr
+    return definition.get("name") or definition.get("Title"), definition
+
+
+def iter_atlas_file(path: Union[str, Path], chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Yield the JSON values of an ATLAS export: the single object of a plain file,
+    or each element of a top-level array, decoded incrementally.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        pos = 0
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if not buf[pos:pos + 1] == "[":
+            yield json.loads(buf + f.read())
+            return
+        pos += 1
+        read_size = chunk_size
+        eof = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(read_size)
+                if len(buf) - pos >= chunk_size:
+                    read_size *= 2  # one huge element: keep its re-decoding amortized
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            read_size = chunk_size
+            yield value
+            pos = end
+            if pos > chunk_size:  # drop consumed text
+                buf, pos = buf[pos:], 0
+
+
+def import_atlas_cohort(definition: Union[Dict[str, Any], str, Path],
+                        name: Optional[str] = None,
+                        source: Optional[str] = None) -> AtlasImportResult:
+    """Import one ATLAS definition (dict, or path to a single-definition JSON file)."""
+    if isinstance(definition, (str, Path)):
+        source = source or str(definition)
+        name = name or Path(definition).stem
+        try:
+            definition = next(iter_atlas_file(definition))
+        except Exception as exc:
+            return AtlasImportResult(name=name, source=source, error=f"{type(exc).__name__}: {exc}")
+    try:
+        found_name, expr = _unwrap(definition)
+        result = AtlasImportResult(name=name or found_name or "cohort", source=source)
+        importer = _Importer(expr)
+        result.criteria = importer.run()
+        result.criteria.to_dict()  # validate the output before it is reported as imported
+        result.issues = importer.issues
+    except Exception as exc:
+        return AtlasImportResult(
+            name=name or "cohort", source=source, error=f"{type(exc).__name__}: {exc}"
+        )
+    return result
+
+
+def _import_batch(batch: List[Tuple[str, str, Any]]) -> List[AtlasImportResult]:
+    """
+    Process-pool worker: import a batch of (name, source, definition). A result
+    that cannot be sent back becomes an error result instead of failing the batch.
+    """
+    results = []
+    for n, s, d in batch:
+        result = import_atlas_cohort(d, name=n, source=s)
+        try:
+            pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            result = AtlasImportResult(name=result.name, source=s, error=f"{type(exc).__name__}: {exc}")
+        results.append(result)
+    return results
+
+
+def _iter_definitions(paths: List[Path]) -> Iterator[Tuple[str, str, Any]]:
+    """Stream (name, source, definition) over many files; unreadable files become error results."""
+    for p in paths:
+        try:
+            for i, value in enumerate(iter_atlas_file(p)):
+                name = value.get("name") if isinstance(value, dict) else None
+                yield name or (p.stem if i == 0 else f"{p.stem}[{i}]"), f"{p}", value
+        except Exception as exc:
+            yield p.stem, f"{p}", exc
+
+
+def import_atlas_directory(directory: Union[str, Path],
+                           pattern: str = "*.json",
+                           max_workers: Optional[int] = None,
+                           batch_size: int = 16) -> Iterator[AtlasImportResult]:
+    """
+    Import every ATLAS export under `directory` in parallel, yielding results in order.
+
+    Files are read incrementally in this process and mapped in a process pool,
+    with at most 2 * max_workers batches in flight, so memory stays bounded
+    regardless of how large the exports are.
+    """
+    paths = sorted(Path(directory).rglob(pattern))
+
+    def batches() -> Iterator[List[Tuple[str, str, Any]]]:
+        batch: List[Tuple[str, str, Any]] = []
+        for item in _iter_definitions(paths):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def unpack(batch) -> List[AtlasImportResult]:
+        return [
+            AtlasImportResult(name=n, source=s, error=f"{type(d).__name__}: {d}")
+            if isinstance(d, Exception) else None
+            for n, s, d in batch
+        ]
+
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        limit = 2 * workers
+        pending: List[Tuple[List[Any], List[Any], Any]] = []
+        for batch in batches():
+            failed = unpack(batch)
+            todo = [b for b, r in zip(batch, failed) if r is None]
+            pending.append((failed, todo, pool.submit(_import_batch, todo)))
+            while len(pending) >= limit:
+                yield from _merge(*pending.pop(0))
+        for failed, todo, fut in pending:
+            yield from _merge(failed, todo, fut)
+
+
+def _merge(failed: List[Optional[AtlasImportResult]], todo: List[Tuple[str, str, Any]],
+           fut) -> Iterator[AtlasImportResult]:
+    """Re-interleave read errors with worker results, preserving input order."""
+    try:
+        results = fut.result()
+    except Exception as exc:  # e.g. a crashed worker: report the batch, keep going
+        results = [AtlasImportResult(name=n, source=s, error=f"{type(exc).__name__}: {exc}") for n, s, _ in todo]
+    done = iter(results)
+    for r in failed:
+        yield r if r is not None else next(done)
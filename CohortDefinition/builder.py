@@ -1,14 +1,16 @@
 # builder.py
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, is_dataclass, MISSING
 from typing import List, Optional, Union, Dict, Any
 from pathlib import Path
+import io
 import os
+import sys
 import tempfile
 import weakref
 import atexit
 import yaml
 
-from CohortDefinition.events import Event
+from CohortDefinition.events import Event, SingleQuoted as _EventSingleQuoted
 
 # ---------- Internal token to prevent direct TemporalBlock construction ----------
 class _Token:
@@ -213,6 +215,25 @@ class CohortCriteria:
             default_flow_style=False,
         )
 
+    # ----------------- Pickling: compact, canonical, no temp-file state -----------------
+    def __getstate__(self) -> tuple:
+        """
+        Compact encoding of the definition tree (see `_encode`). The temp YAML
+        path and its finalizer are process-local and never shipped.
+        """
+        state = [
+            _encode(self.temporal_blocks),
+            _encode(self.demographics),
+            _encode(self.exclusion_blocks),
+            _encode(self.exclusion_demographics),
+        ]
+        while state and state[-1] is None:
+            state.pop()
+        return tuple(state)
+
+    def __reduce__(self):
+        return (_criteria_from_state, (self.__getstate__(),))
+
     # ----------------- Public save API -----------------
     def save(self, path: Union[str, Path]) -> Path:
         """Save the cohort YAML to disk."""
@@ -235,47 +256,63 @@ class CohortCriteria:
         """DEPRECATED: use .save(path) instead."""
         return self.save(path)
     
+    # ----------------- Direct handoff for consumers that accept data -----------------
+    def yaml_stream(self) -> io.StringIO:
+        """
+        The cohort YAML as an in-memory text stream, for consumers that accept a
+        file object (e.g. `yaml.safe_load(cohort.yaml_stream())`). Consumers that
+        accept a dict can take `to_dict()` directly; neither touches disk.
+        """
+        return io.StringIO(self._to_yaml(sort_keys=False))
+
     # Track a lazily-created temp YAML path for this instance (hidden from users)
     _tmp_yaml_path: Optional[str] = field(default=None, repr=False, compare=False)
     _tmp_finalizer: Optional[weakref.finalize] = field(default=None, repr=False, compare=False)
+    _tmp_yaml_fd: Optional[int] = field(default=None, repr=False, compare=False)
+    _tmp_yaml_text: Optional[str] = field(default=None, repr=False, compare=False)
 
     # ----------------- INTERNAL: ensure a temp .yaml exists for path-based APIs -----------------
     def _ensure_temp_yaml_file(self, overwrite: bool = True) -> str:
         """
         Create (or refresh) a temporary .yaml file that mirrors the CURRENT cohort definition.
         This lets external libraries that only accept a YAML *file path* consume this object
-        directly without exposing YAML to end users.
+        directly without exposing YAML to end users. The file lives in memory where
+        possible (see YAML_HANDOFF); it is rewritten only when the definition changed.
         """
         # Create a new temp file if none exists
         if not self._tmp_yaml_path:
-            fd, path = tempfile.mkstemp(prefix="cohort_", suffix=".yaml")
-            os.close(fd)  # we will reopen with text mode
-            self._tmp_yaml_path = path
-            _TEMP_YAML_PATHS.add(path)
-
-            # Register object-finalizer to auto-delete when this cohort is GC'd
-            self._tmp_finalizer = weakref.finalize(self, self._cleanup_temp_yaml_silent, path)
+            self._open_temp_yaml(YAML_HANDOFF)
 
         # (Re)write the latest YAML into the temp file if requested
-        if overwrite and self._tmp_yaml_path:
-            try:
-                with open(self._tmp_yaml_path, "w", encoding="utf-8") as f:
-                    f.write(self._to_yaml(sort_keys=False))
-            except Exception:
-                # If anything goes wrong, fall back to creating a fresh file
-                fd, path = tempfile.mkstemp(prefix="cohort_", suffix=".yaml")
-                os.close(fd)
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(self._to_yaml(sort_keys=False))
-                # update registry
-                if self._tmp_yaml_path:
-                    _TEMP_YAML_PATHS.discard(self._tmp_yaml_path)
-                self._tmp_yaml_path = path
-                _TEMP_YAML_PATHS.add(path)
-                self._tmp_finalizer = weakref.finalize(self, self._cleanup_temp_yaml_silent, path)
+        if overwrite:
+            text = self._to_yaml(sort_keys=False)
+            # A path-backed file may have been removed by a consumer or a tmp cleaner
+            if text != self._tmp_yaml_text or (
+                    self._tmp_yaml_fd is None and not os.path.exists(self._tmp_yaml_path)):
+                try:
+                    _write_handoff(self._tmp_yaml_path, self._tmp_yaml_fd, text)
+                except Exception:
+                    # If anything goes wrong (e.g. tmpfs full), fall back to a fresh file in the temp dir
+                    self._tmp_finalizer()
+                    self._open_temp_yaml("tempfile")
+                    _write_handoff(self._tmp_yaml_path, None, text)
+                self._tmp_yaml_text = text
 
         return self._tmp_yaml_path
 
+    def _open_temp_yaml(self, backing: str) -> None:
+        """Internal: allocate an empty handoff file and register its cleanup."""
+        path, fd = _new_handoff(backing)
+        if self._tmp_finalizer is not None:
+            self._tmp_finalizer()
+        self._tmp_yaml_path, self._tmp_yaml_fd, self._tmp_yaml_text = path, fd, None
+        if fd is None:
+            _TEMP_YAML_PATHS.add(path)
+            # Register object-finalizer to auto-delete when this cohort is GC'd
+            self._tmp_finalizer = weakref.finalize(self, self._cleanup_temp_yaml_silent, path)
+        else:
+            self._tmp_finalizer = weakref.finalize(self, _close_fd_silent, fd)
+
     @staticmethod
     def _cleanup_temp_yaml_silent(path: str) -> None:
         """Internal: silent best-effort delete for a single temp file."""
@@ -296,6 +333,194 @@ class CohortCriteria:
 
     def endswith(self, suffix: str) -> bool:
         """
-        Some external APIs branch on `.endswith('.yaml')`. We proxy that to the temp path.
+        Some external APIs branch on `.endswith('.yaml')`. We proxy that to the temp path
+        (a memfd path has no extension, so its ".yaml" file name stands in).
         """
-        return self._ensure_temp_yaml_file(overwrite=False).endswith(suffix)
+        path = self._ensure_temp_yaml_file(overwrite=False)
+        return (_MEMFD_NAME if self._tmp_yaml_fd is not None else path).endswith(suffix)
+
+
+# ---------- Backing store for the path handoff ----------
+# "auto" picks the first available of:
+#   "shm"      -> a .yaml file on tmpfs (/dev/shm): in memory, still a normal path
+#   "memfd"    -> an anonymous Linux memfd, exposed as /proc/self/fd/N (this process only)
+#   "tempfile" -> a .yaml file in the system temp dir (the portable fallback)
+YAML_HANDOFF = "auto"
+_SHM_DIR = "/dev/shm"
+_MEMFD_NAME = "cohort.yaml"
+
+
+def _shm_available() -> bool:
+    return sys.platform.startswith("linux") and os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK | os.X_OK)
+
+
+def _memfd_available() -> bool:
+    return hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd")
+
+
+def _new_handoff(backing: str):
+    """Empty handoff file for `backing`: (path, fd) where fd is set only for a memfd."""
+    if backing not in ("auto", "shm", "memfd", "tempfile"):
+        raise ValueError(f"Unknown YAML handoff backing {backing!r}; use auto, shm, memfd or tempfile.")
+    if backing in ("auto", "shm") and _shm_available():
+        try:
+            fd, path = tempfile.mkstemp(prefix="cohort_", suffix=".yaml", dir=_SHM_DIR)
+            os.close(fd)
+            return path, None
+        except OSError:
+            pass
+    if backing in ("auto", "memfd") and _memfd_available():
+        try:
+            fd = os.memfd_create(_MEMFD_NAME, os.MFD_CLOEXEC)
+            return f"/proc/self/fd/{fd}", fd
+        except OSError:
+            pass
+    fd, path = tempfile.mkstemp(prefix="cohort_", suffix=".yaml")
+    os.close(fd)  # we will reopen with text mode
+    return path, None
+
+
+def _write_handoff(path: str, fd: Optional[int], text: str) -> None:
+    if fd is None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return
+    data = memoryview(text.encode("utf-8"))
+    os.ftruncate(fd, 0)
+    written = 0
+    while written < len(data):
+        written += os.pwrite(fd, data[written:], written)
+
+
+def _close_fd_silent(fd: int) -> None:
+    try:
+        os.close(fd)
+    except OSError:
+        pass
+
+
+# ---------- Compact encoding used for pickling ----------
+# The tree is flattened to builtin tuples/lists/strs, tagged by a leading control
+# character, so a pickle carries no per-object class or __dict__ overhead:
+#   SingleQuoted s     -> "\x01" + s      (plain strings starting with a tag char get "\x02")
+#   dict               -> (k1, v1, k2, v2, ...)
+#   FlowList           -> ("\x03", *items)
+#   Event dataclass    -> ("\x04", cls, *field values, trailing defaults dropped)
+#   TemporalBlock      -> ("\x05", operator, interval, *events)
+#   Demographics       -> ("\x06", gender, min_birth_year, max_birth_year)
+#   tuple              -> ("\x07", *items)
+# Repeated strings are interned so pickle's memo stores them once per batch.
+_TAG_QUOTED, _TAG_ESCAPED, _TAG_FLOW, _TAG_EVENT, _TAG_BLOCK, _TAG_DEMO, _TAG_TUPLE = (
+    "\x01", "\x02", "\x03", "\x04", "\x05", "\x06", "\x07")
+_TAG_END = "\x08"
+
+
+_SCALARS = (int, float, bool, type(None))
+
+
+def _encode(x: Any) -> Any:
+    t = type(x)
+    if t in _SCALARS:
+        return x
+    if t is str:
+        return _TAG_ESCAPED + x if x and x[0] < _TAG_END else x
+    if t is dict:
+        out: List[Any] = []
+        for k, v in x.items():
+            # Keys are almost always plain strings, values often ints: skip the call
+            out.append(k if type(k) is str and k and k[0] >= _TAG_END else _encode(k))
+            tv = type(v)
+            if tv in _SCALARS:
+                out.append(v)
+            elif tv is SingleQuoted or tv is _EventSingleQuoted:
+                out.append(sys.intern(_TAG_QUOTED + v))
+            else:
+                out.append(_encode(v))
+        return tuple(out)
+    if t is list:
+        return [_encode(v) for v in x]
+    if isinstance(x, (SingleQuoted, _EventSingleQuoted)):
+        return sys.intern(_TAG_QUOTED + x)
+    if isinstance(x, FlowList):
+        return (_TAG_FLOW, *[_encode(v) for v in x])
+    if t is tuple:
+        return (_TAG_TUPLE, *[_encode(v) for v in x])
+    if isinstance(x, TemporalBlock):
+        return (_TAG_BLOCK, _encode(x.operator), _encode(x.interval), *[_encode(e) for e in x.events])
+    if isinstance(x, Demographics):
+        return (_TAG_DEMO, _encode(x.gender), x.min_birth_year, x.max_birth_year)
+    if isinstance(x, Event) and is_dataclass(x):
+        fs = fields(x)
+        values = [getattr(x, f.name) for f in fs]
+        while values and fs[len(values) - 1].default is not MISSING \
+                and values[-1] == fs[len(values) - 1].default:
+            values.pop()
+        return (_TAG_EVENT, type(x), *[_encode(v) for v in values])
+    return x
+
+
+def _decode(x: Any) -> Any:
+    t = type(x)
+    if t is str:
+        if x and x[0] < _TAG_END:
+            return SingleQuoted(x[1:]) if x[0] == _TAG_QUOTED else x[1:]
+        return x
+    if t is tuple:
+        tag = x[0] if x else None
+        if tag == _TAG_FLOW:
+            return FlowList(_decode(v) for v in x[1:])
+        if tag == _TAG_EVENT:
+            return x[1](*[_decode(v) for v in x[2:]])
+        if tag == _TAG_BLOCK:
+            return TemporalBlock(operator=_decode(x[1]), events=[_decode(e) for e in x[3:]],
+                                 interval=_decode(x[2]), _token=TOKEN)
+        if tag == _TAG_DEMO:
+            return Demographics(_decode(x[1]), x[2], x[3])
+        if tag == _TAG_TUPLE:
+            return tuple(_decode(v) for v in x[1:])
+        d: Dict[Any, Any] = {}
+        it = iter(x)
+        for k in it:
+            v = next(it)
+            if type(k) is not str or (k and k[0] < _TAG_END):
+                k = _decode(k)
+            tv = type(v)
+            if tv is str and v and v[0] == _TAG_QUOTED:
+                v = SingleQuoted(v[1:])
+            elif tv not in _SCALARS:
+                v = _decode(v)
+            d[k] = v
+        return d
+    if t is list:
+        return [_decode(v) for v in x]
+    return x
+
+
+def _criteria_from_state(state: tuple) -> "CohortCriteria":
+    """Unpickling hook: rebuild a CohortCriteria from `CohortCriteria.__getstate__()`."""
+    return CohortCriteria(*[_decode(v) for v in state])
+
+
+# ---------- Coercion helper for tools that consume cohort definitions ----------
+def as_criteria_dict(criteria: Union["CohortCriteria", Dict[str, Any], str, Path]) -> Dict[str, Any]:
+    """
+    Normalize a cohort definition to its plain dict form.
+    Accepts a CohortCriteria, an already-materialized dict, or a path to a cohort YAML.
+    """
+    if isinstance(criteria, CohortCriteria):
+        return criteria.to_dict()
+    if isinstance(criteria, dict):
+        return criteria
+    if isinstance(criteria, (str, Path)):
+        with open(criteria, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    raise TypeError(f"Unsupported cohort definition: {type(criteria)}")
+
+
+def freeze_node(node: Any) -> Any:
+    """Hashable, order-preserving key for a YAML node (dicts/lists -> nested tuples)."""
+    if isinstance(node, dict):
+        return tuple((k, freeze_node(v)) for k, v in node.items())
+    if isinstance(node, list):
+        return tuple(freeze_node(v) for v in node)
+    return node
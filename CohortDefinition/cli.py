@@ -0,0 +1,349 @@
+# cli.py
+"""
+Command-line entry point: `python -m CohortDefinition build`.
+
+(Also: `index-concepts` / `search-concepts`, see CohortDefinition.concept_search.)
+
+Spec modules are plain Python files (like the scripts in examples/) that
+define CohortCriteria objects at module level. Every CohortCriteria found in
+the module namespace is emitted as YAML; a module can instead set
+`__cohorts__ = {"name": cohort, ...}` to choose the output names itself.
+
+    python -m CohortDefinition build specs/ -o yaml/
+    python -m CohortDefinition build specs/ -o yaml/ --watch
+
+Builds are incremental. A manifest (<out>/.cohort_manifest.json) records, per
+spec (by resolved path), its size/mtime and a content hash, plus a hash of
+each emitted YAML:
+- a spec whose size/mtime are unchanged and whose outputs all still exist is
+  skipped without reading it;
+- a touched spec whose content hash is unchanged is skipped without running it;
+- an emitted YAML is only rewritten when its content changed;
+- outputs of deleted specs (or cohorts removed from a spec) are deleted;
+- two specs emitting the same output file is an error for the later one.
+Changes to this package itself invalidate every spec. Changes to helper
+modules that specs import are not tracked; use --force after editing them.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import runpy
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from CohortDefinition.builder import CohortCriteria
+
+MANIFEST_NAME = ".cohort_manifest.json"
+MANIFEST_VERSION = 1
+
+_PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _package_fingerprint() -> str:
+    """Hash of this package's sources: emitted YAML depends on them."""
+    h = hashlib.sha256()
+    for p in sorted(_PACKAGE_DIR.glob("*.py")):
+        h.update(p.name.encode())
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+# ---------- Discovery ----------
+def discover_specs(paths: Sequence[Path], pattern: str = "*.py",
+                   exclude: Sequence[Path] = ()) -> Iterator[Tuple[Path, Path]]:
+    """Yield (root, spec_path) for every spec module under `paths`."""
+    excluded = {p.resolve() for p in exclude}
+    for root in paths:
+        root = Path(root)
+        if root.is_file():
+            yield root.parent, root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            here = Path(dirpath)
+            dirnames[:] = sorted(
+                d for d in dirnames
+                if not d.startswith((".", "_")) and (here / d).resolve() not in excluded
+            )
+            for name in sorted(filenames):
+                if name.startswith("_") or not Path(name).match(pattern):
+                    continue
+                yield root, here / name
+
+
+# ---------- Running one spec ----------
+def collect_cohorts(namespace: Dict[str, Any]) -> Dict[str, CohortCriteria]:
+    """Cohorts defined by an executed spec module, by output name."""
+    explicit = namespace.get("__cohorts__")
+    if explicit is not None:
+        return dict(explicit)
+    return {
+        k: v for k, v in namespace.items()
+        if isinstance(v, CohortCriteria) and not k.startswith("_")
+    }
+
+
+def render_spec(path: str) -> List[Tuple[str, str]]:
+    """
+    Execute one spec module and return [(output_stem, yaml_text), ...].
+    Runs in a worker process; the spec's stdout (e.g. print(cohort)) is discarded.
+    """
+    spec = Path(path)
+    sys.path.insert(0, str(spec.parent))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            namespace = runpy.run_path(str(spec), run_name="__cohort_spec__")
+    finally:
+        sys.path.remove(str(spec.parent))
+    cohorts = collect_cohorts(namespace)
+    if len(cohorts) == 1 and "__cohorts__" not in namespace:
+        (_, cohort), = cohorts.items()
+        return [(spec.stem, str(cohort))]
+    return [
+        (name if "__cohorts__" in namespace else f"{spec.stem}_{name}", str(cohort))
+        for name, cohort in cohorts.items()
+    ]
+
+
+def _render_safe(path: str) -> Tuple[str, Optional[List[Tuple[str, str]]], Optional[str]]:
+    try:
+        return path, render_spec(path), None
+    except BaseException as exc:  # a spec calling sys.exit() must not kill the build
+        return path, None, f"{type(exc).__name__}: {exc}"
+
+
+# ---------- Manifest ----------
+@dataclass
+class BuildReport:
+    """What one build pass did."""
+    specs: int = 0
+    skipped: int = 0
+    rendered: List[str] = field(default_factory=list)
+    written: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.specs} spec(s): {self.skipped} unchanged, {len(self.rendered)} rebuilt, "
+            f"{len(self.written)} YAML written, {len(self.removed)} removed, "
+            f"{len(self.errors)} failed in {self.seconds:.2f}s"
+        )
+
+
+def _load_manifest(path: Path, fingerprint: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION or data.get("package") != fingerprint:
+        # Keep output bookkeeping so stale files can still be cleaned up
+        return {k: {"outputs": v.get("outputs", {})} for k, v in data.get("specs", {}).items()}
+    return data.get("specs", {})
+
+
+def build(paths: Sequence[Path], out: Path, jobs: Optional[int] = None,
+          force: bool = False, pattern: str = "*.py") -> BuildReport:
+    """Run one incremental build pass and return what changed."""
+    started = time.perf_counter()
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / MANIFEST_NAME
+    fingerprint = _package_fingerprint()
+    old = {} if force else _load_manifest(manifest_path, fingerprint)
+    new: Dict[str, Any] = {}
+    stale_outputs = set()
+    report = BuildReport()
+
+    todo: Dict[str, Tuple[Path, Dict[str, Any]]] = {}  # spec key -> (output dir, entry)
+    owners: Dict[str, str] = {}  # output path (relative to out) -> spec key claiming it this pass
+    for root, spec in discover_specs(paths, pattern, exclude=[out]):
+        report.specs += 1
+        key = spec.resolve().as_posix()  # the same spec whichever way its path was typed
+        st = spec.stat()
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        prev = old.get(key, {})
+        target_dir = out / spec.parent.relative_to(root)
+        prev_outputs = prev.get("outputs", {})
+        outputs_intact = all((out / rel).exists() and rel not in owners for rel in prev_outputs)
+        if outputs_intact and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns \
+                and "sha256" in prev:
+            new[key] = prev
+            owners.update(dict.fromkeys(prev_outputs, key))
+            report.skipped += 1
+            continue
+        entry["sha256"] = _sha256(spec.read_bytes())
+        if outputs_intact and prev.get("sha256") == entry["sha256"]:
+            new[key] = {**prev, **entry}
+            owners.update(dict.fromkeys(prev_outputs, key))
+            report.skipped += 1
+            continue
+        entry["outputs"] = prev_outputs
+        todo[key] = (target_dir, entry)
+
+    for key, rendered, error in _render_all(list(todo), jobs):
+        target_dir, entry = todo[key]
+        if error is None:
+            clashes = sorted(
+                f"{rel} (also from {owners[rel]})" for rel in
+                ((target_dir / f"{stem}.yaml").relative_to(out).as_posix() for stem, _ in rendered or [])
+                if rel in owners
+            )
+            if clashes:
+                error = f"output collision: {', '.join(clashes)}"
+        if error is not None:
+            report.errors[key] = error
+            if key in old:
+                new[key] = old[key]  # keep previous outputs; retry next time
+            continue
+        report.rendered.append(key)
+        outputs: Dict[str, str] = {}
+        for stem, text in rendered or []:
+            target = target_dir / f"{stem}.yaml"
+            digest = _sha256(text.encode("utf-8"))
+            rel = target.relative_to(out).as_posix()
+            outputs[rel] = digest
+            owners[rel] = key
+            if entry["outputs"].get(rel) != digest or not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(text, encoding="utf-8")
+                report.written.append(rel)
+        stale = set(entry["outputs"]) - set(outputs)
+        entry["outputs"] = outputs
+        new[key] = entry
+        stale_outputs.update(stale)
+
+    # Outputs of deleted specs (or cohorts removed from a spec); a file any spec
+    # still produces in this pass is never removed.
+    for key in set(old) - set(new):
+        stale_outputs.update(old[key].get("outputs", {}))
+    claimed = {rel for entry in new.values() for rel in entry.get("outputs", {})}
+    for rel in sorted(stale_outputs - claimed):
+        _remove(out / rel, report)
+
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "package": fingerprint, "specs": new}),
+        encoding="utf-8",
+    )
+    os.replace(tmp, manifest_path)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _remove(path: Path, report: BuildReport) -> None:
+    try:
+        path.unlink()
+        report.removed.append(path.name)
+    except FileNotFoundError:
+        pass
+
+
+def _render_all(keys: List[str], jobs: Optional[int]):
+    """Render specs; a process pool is only started when it can pay for itself."""
+    if not keys:
+        return
+    workers = min(jobs or os.cpu_count() or 1, len(keys))
+    if workers <= 1:
+        for key in keys:
+            yield _render_safe(key)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_render_safe, keys, chunksize=max(1, len(keys) // (workers * 4)))
+
+
+# ---------- Watch mode ----------
+def _snapshot(paths: Sequence[Path], pattern: str, out: Path) -> Dict[str, Tuple[int, int]]:
+    snap = {}
+    for _, spec in discover_specs(paths, pattern, exclude=[out]):
+        try:
+            st = spec.stat()
+        except FileNotFoundError:
+            continue
+        snap[spec.as_posix()] = (st.st_size, st.st_mtime_ns)
+    return snap
+
+
+def watch(paths: Sequence[Path], out: Path, jobs: Optional[int] = None,
+          pattern: str = "*.py", interval: float = 1.0) -> None:
+    """Rebuild whenever a spec is added, changed or removed (polling; Ctrl-C to stop)."""
+    last = None
+    while True:
+        snap = _snapshot(paths, pattern, out)
+        if snap != last:
+            report = build(paths, out, jobs=jobs, pattern=pattern)
+            _print_report(report)
+            last = snap
+        time.sleep(interval)
+
+
+def _print_report(report: BuildReport) -> None:
+    for key, err in sorted(report.errors.items()):
+        print(f"error: {key}: {err}", file=sys.stderr)
+    print(report.summary())
+
+
+# ---------- argparse ----------
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m CohortDefinition")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+
+    b = sub.add_parser("build", help="Build cohort YAML from Python spec modules.")
+    b.add_argument("paths", nargs="+", type=Path, help="Spec files or directories.")
+    b.add_argument("-o", "--out", type=Path, default=Path("yaml"), help="Output directory (default: yaml).")
+    b.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    b.add_argument("--pattern", default="*.py", help="Spec file glob (default: *.py).")
+    b.add_argument("--force", action="store_true", help="Ignore the manifest and rebuild everything.")
+    b.add_argument("--watch", action="store_true", help="Keep running and rebuild on changes.")
+    b.add_argument("--interval", type=float, default=1.0, help="Watch polling interval in seconds.")
+
+    ix = sub.add_parser("index-concepts", help="Build a concept-name search index.")
+    ix.add_argument("vocabulary", type=Path, nargs="?", default=None,
+                    help="Athena CONCEPT.csv (default: the package mapping CSV).")
+    ix.add_argument("-o", "--out", type=Path, default=Path("concepts.idx"), help="Index file (default: concepts.idx).")
+    ix.add_argument("--domain", action="append", default=None, help="Keep only this domain (repeatable).")
+    ix.add_argument("--standard-only", action="store_true", help="Keep only standard concepts.")
+
+    sc = sub.add_parser("search-concepts", help="Search a concept-name index.")
+    sc.add_argument("query")
+    sc.add_argument("-i", "--index", type=Path, default=Path("concepts.idx"), help="Index file (default: concepts.idx).")
+    sc.add_argument("--domain", default=None, help="OMOP domain or event type, e.g. condition_occurrence.")
+    sc.add_argument("-n", "--limit", type=int, default=10)
+    sc.add_argument("--no-fuzzy", action="store_true", help="Disable typo-tolerant matching.")
+
+    args = parser.parse_args(argv)
+    if args.command == "index-concepts":
+        from CohortDefinition.concept_search import ConceptIndex
+        out = ConceptIndex.build(args.vocabulary, args.out, domains=args.domain, standard_only=args.standard_only)
+        with ConceptIndex.open(out) as idx:
+            print(f"{len(idx)} concepts indexed in {out}")
+        return 0
+    if args.command == "search-concepts":
+        from CohortDefinition.concept_search import ConceptIndex
+        with ConceptIndex.open(args.index) as idx:
+            for m in idx.search(args.query, domain=args.domain, limit=args.limit, fuzzy=not args.no_fuzzy):
+                print(f"{m.concept_id}\t{m.domain}\t{'S' if m.standard else '-'}\t{m.score:.3f}\t{m.name}")
+        return 0
+    if args.command == "build":
+        if args.watch:
+            try:
+                watch(args.paths, args.out, jobs=args.jobs, pattern=args.pattern, interval=args.interval)
+            except KeyboardInterrupt:
+                return 0
+        report = build(args.paths, args.out, jobs=args.jobs, force=args.force, pattern=args.pattern)
+        _print_report(report)
+        return 1 if report.errors else 0
+    return 2
@@ -0,0 +1,445 @@
+# concept_search.py
+"""
+Local concept-name search over a full OMOP vocabulary.
+
+Build an index once from an Athena CONCEPT.csv (tab-separated) or from the
+package's ohdsi_to_snomed_map.csv, then open it instantly (memory-mapped, no
+parsing) and query it as often as needed:
+
+    ConceptIndex.build("vocab/CONCEPT.csv", "concepts.idx")
+    with ConceptIndex.open("concepts.idx") as idx:
+        for m in idx.search("type 2 diab", domain="condition_occurrence"):
+            print(m.concept_id, m.name)       # concept_id goes into event_concept_id
+
+Matching and ranking:
+- names equal to / starting with the query come from a sorted dictionary of
+  normalized full names; otherwise every query word is matched as a word
+  prefix ("diab" -> "diabetes"). Results rank as exact name > name starts
+  with the query > all words present, then by how much of the name the
+  query covers;
+- if that yields fewer than `limit` results and `fuzzy` is on, a trigram
+  search tolerates typos ("diabetis") and ranks by trigram Jaccard similarity;
+- ties favour standard concepts, then shorter names.
+`domain` accepts OMOP domain ids ("Condition") or event types
+("condition_occurrence").
+
+File layout (little-endian, every section 8-byte aligned): a fixed header,
+a JSON block of domain names, then concept ids / flags / name offsets, the
+UTF-8 names blob, and three sorted string dictionaries (normalized full
+names, word tokens, trigrams), each with offsets into a uint32 postings
+array of concept rows. Queries touch only the pages they need.
+"""
+
+import csv
+import heapq
+import json
+import mmap
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from CohortDefinition.events import _SNOMED_MAP_FILE
+
+_MAGIC = b"CDCIDX01"
+# magic, concept count, meta (offset, length), 4 concept sections, 3 x 5 dictionary fields
+_HEADER = struct.Struct("<8s22Q")
+
+# event_type -> OMOP domain_id, so users can filter with the names they build events with
+EVENT_TYPE_DOMAINS: Dict[str, str] = {
+    "condition_occurrence": "Condition",
+    "drug_exposure": "Drug",
+    "procedure_occurrence": "Procedure",
+    "measurement": "Measurement",
+    "visit_occurrence": "Visit",
+}
+
+# Total postings fuzzy search may walk; the most common trigrams are skipped first
+_FUZZY_MAX_POSTINGS = 60_000
+# Candidates examined per matching tier; very unselective queries ("a") are capped
+_MAX_PREFIX_CANDIDATES = 10_000
+# A prefix spanning at most this many tokens is checked by binary search in its postings
+_MAX_BISECT_TOKENS = 16
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation: 'Sjögren's Syndrome' -> 'sjogren s syndrome'."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def trigrams(norm: str) -> Set[str]:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class ConceptMatch:
+    concept_id: int
+    name: str
+    domain: str
+    standard: bool
+    score: float
+
+
+# ---------- Reading vocabularies ----------
+def read_vocabulary(path: Union[str, Path, None] = None) -> Iterator[Tuple[int, str, str, bool]]:
+    """
+    Yield (concept_id, name, domain_id, is_standard) rows.
+
+    Understands Athena CONCEPT.csv (tab-separated, concept_id/concept_name/
+    domain_id/standard_concept) and the package mapping CSV (default), whose
+    `snomed_code` column holds the id used as event_concept_id.
+    """
+    path = Path(path) if path is not None else _SNOMED_MAP_FILE
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        delimiter = "\t" if first.count("\t") > first.count(",") else ","
+        csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+        reader = csv.DictReader(f, delimiter=delimiter, quoting=csv.QUOTE_NONE if delimiter == "\t" else csv.QUOTE_MINIMAL)
+        fields = set(reader.fieldnames or [])
+        if {"concept_id", "concept_name"} <= fields:
+            for row in reader:
+                try:
+                    cid = int(row["concept_id"])
+                except (TypeError, ValueError):
+                    continue
+                if row.get("invalid_reason"):
+                    continue
+                yield cid, row["concept_name"] or "", row.get("domain_id") or "", row.get("standard_concept") == "S"
+        elif {"snomed_code", "description"} <= fields:
+            for row in reader:
+                try:
+                    cid = int(row["snomed_code"])
+                except (TypeError, ValueError):
+                    continue
+                yield cid, row["description"] or "", "Condition", True
+        else:
+            raise ValueError(f"{path}: unrecognised vocabulary columns {sorted(fields)}")
+
+
+# ---------- Index ----------
+def _pad8(f) -> int:
+    pos = f.tell()
+    if pos % 8:
+        f.write(b"\0" * (8 - pos % 8))
+    return f.tell()
+
+
+def _write_array(f, arr: array) -> int:
+    off = _pad8(f)
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    arr.tofile(f)
+    return off
+
+
+def _write_dictionary(f, postings: Dict[str, array]) -> Tuple[int, int, int, int, int]:
+    """Write a sorted string dictionary; returns (count, key_offs, keys, post_offs, postings)."""
+    keys = sorted(postings, key=lambda k: k.encode("utf-8"))
+    key_offs, post_offs = array("Q", [0]), array("Q", [0])
+    blob = bytearray()
+    flat = array("I")
+    for k in keys:
+        blob += k.encode("utf-8")
+        key_offs.append(len(blob))
+        flat.extend(postings[k])
+        post_offs.append(len(flat))
+    o1 = _write_array(f, key_offs)
+    o2 = _pad8(f)
+    f.write(blob)
+    o3 = _write_array(f, post_offs)
+    o4 = _write_array(f, flat)
+    return len(keys), o1, o2, o3, o4
+
+
+class _Dictionary:
+    """Read side of a sorted string dictionary over the mapped file."""
+
+    def __init__(self, mv: memoryview, count: int, key_offs: int, keys: int, post_offs: int, postings: int):
+        self.count = count
+        self.key_offs = mv[key_offs:key_offs + 8 * (count + 1)].cast("Q")
+        self.keys = mv[keys:keys + self.key_offs[count]]
+        self.post_offs = mv[post_offs:post_offs + 8 * (count + 1)].cast("Q")
+        self.postings = mv[postings:postings + 4 * self.post_offs[count]].cast("I")
+
+    def key(self, i: int) -> bytes:
+        return bytes(self.keys[self.key_offs[i]:self.key_offs[i + 1]])
+
+    def lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, key: bytes) -> Optional[int]:
+        i = self.lower_bound(key)
+        return i if i < self.count and self.key(i) == key else None
+
+    def prefix_range(self, prefix: bytes) -> Tuple[int, int]:
+        start = self.lower_bound(prefix)
+        # the first key >= prefix + 0xff.. bounds the range
+        end = self.lower_bound(prefix + b"\xff")
+        return start, end
+
+    def posting_size(self, start: int, end: int) -> int:
+        return self.post_offs[end] - self.post_offs[start]
+
+    def postings_of(self, start: int, end: int) -> memoryview:
+        return self.postings[self.post_offs[start]:self.post_offs[end]]
+
+
+def _contains(sorted_postings: memoryview, row: int) -> bool:
+    i = bisect_left(sorted_postings, row)
+    return i < len(sorted_postings) and sorted_postings[i] == row
+
+
+class ConceptIndex:
+    """Memory-mapped concept-name index; see the module docstring."""
+
+    # ----------------- Build -----------------
+    @staticmethod
+    def build(vocabulary: Union[str, Path, Iterable[Tuple[int, str, str, bool]], None],
+              out: Union[str, Path],
+              domains: Optional[Iterable[str]] = None,
+              standard_only: bool = False) -> Path:
+        """
+        Build an index file from a vocabulary file (see read_vocabulary) or rows.
+        `domains` / `standard_only` drop concepts up front to keep the file small.
+        """
+        rows = read_vocabulary(vocabulary) if vocabulary is None or isinstance(vocabulary, (str, Path)) else vocabulary
+        keep = {EVENT_TYPE_DOMAINS.get(d, d) for d in domains} if domains else None
+
+        ids = array("q")
+        flags = array("I")  # domain index << 1 | standard
+        name_offs = array("Q", [0])
+        names = bytearray()
+        domain_ids: Dict[str, int] = {}
+        full_names: Dict[str, array] = {}
+        tokens: Dict[str, array] = {}
+        grams: Dict[str, array] = {}
+        for cid, name, domain, standard in rows:
+            if keep is not None and domain not in keep:
+                continue
+            if standard_only and not standard:
+                continue
+            row = len(ids)
+            ids.append(int(cid))
+            d = domain_ids.setdefault(domain, len(domain_ids))
+            flags.append((d << 1) | (1 if standard else 0))
+            names += name.encode("utf-8")
+            name_offs.append(len(names))
+            norm = normalize(name)
+            full_names.setdefault(norm, array("I")).append(row)
+            for tok in set(norm.split()):
+                tokens.setdefault(tok, array("I")).append(row)
+            for g in trigrams(norm):
+                grams.setdefault(g, array("I")).append(row)
+
+        out = Path(out)
+        tmp = out.with_name(out.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            meta = json.dumps({"domains": sorted(domain_ids, key=domain_ids.get)}).encode("utf-8")
+            meta_off = _pad8(f)
+            f.write(meta)
+            o_ids = _write_array(f, ids)
+            o_flags = _write_array(f, flags)
+            o_noffs = _write_array(f, name_offs)
+            o_names = _pad8(f)
+            f.write(names)
+            full = _write_dictionary(f, full_names)
+            tok = _write_dictionary(f, tokens)
+            tri = _write_dictionary(f, grams)
+            f.seek(0)
+            f.write(_HEADER.pack(
+                _MAGIC, len(ids), meta_off, len(meta), o_ids, o_flags, o_noffs, o_names,
+                *full, *tok, *tri
+            ))
+        tmp.replace(out)
+        return out
+
+    # ----------------- Open -----------------
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = memoryview(self._mm)
+        fields = _HEADER.unpack_from(self._mm, 0)
+        magic, n, meta_off, meta_len, o_ids, o_flags, o_noffs, o_names = fields[:8]
+        if magic != _MAGIC:
+            raise ValueError(f"{self.path} is not a concept index (bad magic {magic!r}).")
+        if sys.byteorder != "little":  # pragma: no cover - no big-endian CI
+            raise RuntimeError("Concept indexes are little-endian; this platform is not supported.")
+        self._mv = mv
+        self.size = n
+        self.domains: List[str] = json.loads(bytes(mv[meta_off:meta_off + meta_len]))["domains"]
+        self._ids = mv[o_ids:o_ids + 8 * n].cast("q")
+        self._flags = mv[o_flags:o_flags + 4 * n].cast("I")
+        self._name_offs = mv[o_noffs:o_noffs + 8 * (n + 1)].cast("Q")
+        self._names = mv[o_names:o_names + self._name_offs[n]]
+        self._full = _Dictionary(mv, *fields[8:13])
+        self._tokens = _Dictionary(mv, *fields[13:18])
+        self._grams = _Dictionary(mv, *fields[18:23])
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "ConceptIndex":
+        return cls(path)
+
+    def close(self) -> None:
+        for view in ("_ids", "_flags", "_name_offs", "_names"):
+            getattr(self, view).release()
+        for d in (self._full, self._tokens, self._grams):
+            for view in (d.key_offs, d.keys, d.post_offs, d.postings):
+                view.release()
+        self._mv.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "ConceptIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    # ----------------- Row access -----------------
+    def name(self, row: int) -> str:
+        return bytes(self._names[self._name_offs[row]:self._name_offs[row + 1]]).decode("utf-8")
+
+    def _match(self, row: int, score: float) -> ConceptMatch:
+        flags = self._flags[row]
+        return ConceptMatch(
+            concept_id=self._ids[row], name=self.name(row),
+            domain=self.domains[flags >> 1], standard=bool(flags & 1), score=round(score, 4),
+        )
+
+    # ----------------- Search -----------------
+    def search(self, query: str, domain: Optional[str] = None, limit: int = 10,
+               fuzzy: bool = True, standard_only: bool = False) -> List[ConceptMatch]:
+        """Return up to `limit` concepts matching `query`, best first."""
+        norm = normalize(query)
+        if not norm:
+            return []
+        allowed = None
+        if domain is not None:
+            wanted = EVENT_TYPE_DOMAINS.get(domain, domain)
+            allowed = {i for i, d in enumerate(self.domains) if d.lower() == wanted.lower()}
+            if not allowed:
+                return []
+
+        def ok(row: int) -> bool:
+            flags = self._flags[row]
+            if standard_only and not flags & 1:
+                return False
+            return allowed is None or (flags >> 1) in allowed
+
+        qlen = len(norm)
+        scored: Dict[int, Tuple[float, float, int]] = {}
+
+        def add(row: int, tier: float) -> None:
+            if row in scored or not ok(row):
+                return
+            name_len = self._name_offs[row + 1] - self._name_offs[row]
+            closeness = min(qlen / max(name_len, 1), 0.999)  # share of the name the query covers
+            scored[row] = (tier + closeness, float(self._flags[row] & 1), -name_len)
+
+        # Tiers 3 / 2: the normalized name equals / starts with the query
+        key = norm.encode("utf-8")
+        start, end = self._full.prefix_range(key)
+        examined = 0
+        for i in range(start, end):
+            tier = 3.0 if self._full.key(i) == key else 2.0
+            for row in self._full.postings_of(i, i + 1):
+                add(row, tier)
+            examined += 1
+            if examined >= _MAX_PREFIX_CANDIDATES:
+                break
+        # Tier 1: every query word prefixes some word of the name
+        if len(scored) < limit:
+            for row in self._word_candidates(norm.split()):
+                add(row, 1.0)
+        # Tier 0: trigram similarity, for typos
+        if fuzzy and len(scored) < limit:
+            for row, sim in self._fuzzy_candidates(norm, limit * 20):
+                if row not in scored and ok(row):
+                    scored[row] = (sim, float(self._flags[row] & 1), -self._name_len(row))
+        best = heapq.nlargest(limit, scored.items(), key=lambda kv: (kv[1], -kv[0]))
+        return [self._match(row, k[0]) for row, k in best]
+
+    def _name_len(self, row: int) -> int:
+        return self._name_offs[row + 1] - self._name_offs[row]
+
+    def _word_candidates(self, words: List[str]) -> Set[int]:
+        ranges = []
+        for w in words:
+            start, end = self._tokens.prefix_range(w.encode("utf-8"))
+            if start >= end:
+                return set()
+            ranges.append((self._tokens.posting_size(start, end), start, end, w))
+        ranges.sort()  # rarest word first
+        _, start, end, _ = ranges[0]
+        cands: Set[int] = set()
+        postings, base = self._tokens.postings, self._tokens.post_offs
+        for i in range(start, end):
+            cands.update(postings[base[i]:base[i + 1]])
+            if len(cands) >= _MAX_PREFIX_CANDIDATES:
+                break
+        for size, start, end, w in ranges[1:]:
+            if not cands:
+                break
+            if size <= 4 * len(cands):
+                cands &= set(self._tokens.postings_of(start, end))
+            elif end - start <= _MAX_BISECT_TOKENS:
+                lists = [self._tokens.postings_of(i, i + 1) for i in range(start, end)]
+                cands = {r for r in cands if any(_contains(lst, r) for lst in lists)}
+            else:  # very generic prefix: check the candidates' names directly
+                cands = {r for r in cands if any(t.startswith(w) for t in normalize(self.name(r)).split())}
+        return cands
+
+    def _fuzzy_candidates(self, norm: str, keep: int) -> List[Tuple[int, float]]:
+        q = trigrams(norm)
+        lists = []
+        for g in q:
+            i = self._grams.find(g.encode("utf-8"))
+            if i is not None:
+                lists.append((self._grams.posting_size(i, i + 1), i))
+        lists.sort()
+        counts: Dict[int, int] = {}
+        budget = _FUZZY_MAX_POSTINGS
+        used = 0
+        for size, i in lists:
+            if size > budget:
+                break
+            budget -= size
+            used += 1
+            for row in self._grams.postings_of(i, i + 1):
+                counts[row] = counts.get(row, 0) + 1
+        if not counts:
+            return []
+        # Rank the best-covered candidates by exact trigram Jaccard similarity
+        need = max(1, (used + 2) // 3)
+        top = heapq.nlargest(keep, (kv for kv in counts.items() if kv[1] >= need), key=lambda kv: kv[1])
+        out = []
+        for row, _ in top:
+            grams = trigrams(normalize(self.name(row)))
+            shared = len(q & grams)
+            out.append((row, min(shared / (len(q) + len(grams) - shared), 0.999)))
+        out.sort(key=lambda t: t[1], reverse=True)
+        return out
@@ -0,0 +1,119 @@
+# omop.py
+"""
+Shared helpers for reading a *local* OMOP CDM extract.
+
+A "source" is either:
+- a DuckDB database file (e.g. synpuf_100k_omop_54.duckdb), or
+- a directory of Parquet files named after the OMOP tables
+  (person.parquet, condition_occurrence.parquet, ... or person/*.parquet).
+
+DuckDB is an optional dependency; it is imported lazily so the YAML builder
+keeps working with only PyYAML installed.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+# event_type (as emitted in the cohort YAML) -> (concept column, start date column)
+DOMAIN_TABLES: Dict[str, Tuple[str, str]] = {
+    "condition_occurrence": ("condition_concept_id", "condition_start_date"),
+    "drug_exposure": ("drug_concept_id", "drug_exposure_start_date"),
+    "procedure_occurrence": ("procedure_concept_id", "procedure_date"),
+    "measurement": ("measurement_concept_id", "measurement_date"),
+    "visit_occurrence": ("visit_concept_id", "visit_start_date"),
+}
+
+# Demographics.gender value -> OMOP gender_concept_id
+GENDER_CONCEPTS: Dict[str, int] = {"male": 8507, "female": 8532}
+
+OMOP_TABLES: List[str] = ["person"] + list(DOMAIN_TABLES)
+
+Source = Union[str, Path]
+
+
+def require_duckdb():
+    """Import duckdb or raise a helpful ImportError."""
+    try:
+        import duckdb  # type: ignore
+    except ImportError as exc:  # pragma: no cover - depends on environment
+        raise ImportError(
+            "This feature needs DuckDB to read local OMOP data. "
+            "Install it with `pip install duckdb`."
+        ) from exc
+    return duckdb
+
+
+def require_numpy():
+    """Import numpy or raise a helpful ImportError."""
+    try:
+        import numpy as np  # type: ignore
+    except ImportError as exc:  # pragma: no cover - depends on environment
+        raise ImportError(
+            "This feature needs NumPy. Install it with `pip install numpy`."
+        ) from exc
+    return np
+
+
+def _parquet_glob(root: Path, table: str) -> Union[str, None]:
+    """Return a read_parquet() glob for `table` under `root`, or None if absent."""
+    single = root / f"{table}.parquet"
+    if single.exists():
+        return str(single)
+    folder = root / table
+    if folder.is_dir() and any(folder.glob("*.parquet")):
+        return str(folder / "*.parquet")
+    return None
+
+
+def connect(source: Source, read_only: bool = True):
+    """
+    Open a DuckDB connection over a local OMOP source.
+
+    For a Parquet directory an in-memory connection is returned with one view
+    per OMOP table found, so callers can always write plain `FROM person`.
+    """
+    duckdb = require_duckdb()
+    root = Path(source)
+    if root.is_dir():
+        con = duckdb.connect()
+        for table in OMOP_TABLES:
+            glob = _parquet_glob(root, table)
+            if glob is not None:
+                con.execute(
+                    f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{glob}')"
+                )
+        return con
+    if not root.exists():
+        raise FileNotFoundError(f"OMOP source not found: {root}")
+    return duckdb.connect(str(root), read_only=read_only)
+
+
+def attach_source(con, source: Source, alias: str = "src") -> Dict[str, str]:
+    """
+    Make the OMOP tables of `source` readable from another connection `con`
+    (e.g. one writing a derived DuckDB file). Returns table -> SQL relation.
+    """
+    root = Path(source)
+    if root.is_dir():
+        out = {}
+        for table in OMOP_TABLES:
+            glob = _parquet_glob(root, table)
+            if glob is not None:
+                out[table] = f"read_parquet('{glob}')"
+        return out
+    if not root.exists():
+        raise FileNotFoundError(f"OMOP source not found: {root}")
+    con.execute(f"ATTACH '{root}' AS {alias} (READ_ONLY)")
+    names = {r[0].lower() for r in con.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_catalog = ?", [alias]
+    ).fetchall()}
+    return {t: f"{alias}.{t}" for t in OMOP_TABLES if t in names}
+
+
+def available_tables(con) -> List[str]:
+    """Return the OMOP tables (or views) visible on `con`."""
+    rows = con.execute(
+        "SELECT table_name FROM information_schema.tables"
+    ).fetchall()
+    names = {r[0].lower() for r in rows}
+    return [t for t in OMOP_TABLES if t in names]
@@ -0,0 +1,363 @@
+# planner.py
+"""
+Baseline-relative (delta) query planning for study cohorts.
+
+Bias studies run a baseline cohort and several studies that refine it, e.g.
+the diabetes baseline (T2DM) and study1 (T2DM, male, born <= 1990). When a
+study is provably a subset of the baseline, only its *extra* criteria need
+to be evaluated, and only against the baseline's materialized persons:
+
+    plan = plan_cohorts({"baseline": baseline, "study1": study1, "study2": study2})
+    print(plan.explain())
+    result = plan.execute(omop.connect("synthetic.duckdb"))
+    result.counts["study1"]
+
+A study S is planned on a baseline B when every conjunct of B is implied by S:
+- each demographic field of B is present in S with the same gender or a
+  birth-year bound at least as tight;
+- every top-level temporal group of B appears (structurally identical) in S,
+  or is a plain conjunction of events that S already requires positively
+  (through AND/BEFORE, not under OR/NOT) — e.g. baseline "COVID" is implied
+  by a study group "ER visit AND (2020-03-15 BEFORE COVID ...)";
+- B has no exclusion criteria, or S has exactly the same ones.
+The delta is S's differing demographic fields, its remaining temporal groups
+and, when B has none, S's exclusion criteria.
+
+`run_cohorts_shared(con, cohorts)` is the alternative for sets that do not
+refine one another: all cohorts in one query over shared event scans
+(sql.compile_cohorts), returning every cohort's persons at once.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+from CohortDefinition.builder import as_criteria_dict, freeze_node
+from CohortDefinition.sql import compile_cohort, compile_cohorts
+
+
+# Semi-join event scans to the baseline only when it holds at most this share of
+# all persons; for larger baselines the join costs more than the rows it skips.
+SCAN_RESTRICT_MAX_SHARE = 0.25
+
+
+# ---------- Delta detection ----------
+def _demographics_delta(base: Dict[str, Any], study: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Study demographic fields not already enforced by the baseline (None if not a refinement)."""
+    extra: Dict[str, Any] = {}
+    if base.get("gender"):
+        if str(study.get("gender") or "").lower() != str(base["gender"]).lower():
+            return None
+    elif study.get("gender"):
+        extra["gender"] = study["gender"]
+    for key, tighter in (("min_birth_year", lambda s, b: s >= b), ("max_birth_year", lambda s, b: s <= b)):
+        b, s = base.get(key), study.get(key)
+        if b is not None:
+            if s is None or not tighter(int(s), int(b)):
+                return None
+            if int(s) != int(b):
+                extra[key] = s
+        elif s is not None:
+            extra[key] = s
+    return extra
+
+
+def _leaf_key(ev: Dict[str, Any], with_instance: bool = True) -> Any:
+    """Identity of an event for existence checks (offset never changes existence)."""
+    inst = ev.get("event_instance") if with_instance else None
+    return (str(ev.get("event_type")), ev.get("event_concept_id"), inst,
+            freeze_node({k: v for k, v in ev.items()
+                         if k not in ("event_type", "event_concept_id", "event_instance", "offset")}))
+
+
+def _required_leaves(node: Dict[str, Any], out: set) -> set:
+    """Events every person satisfying `node` must have (AND/BEFORE paths only)."""
+    op = node.get("operator")
+    if op is None:
+        if node.get("event_type") != "date":
+            out.add(_leaf_key(node))
+            out.add(_leaf_key(node, with_instance=False))
+        return out
+    if str(op).upper() in ("AND", "BEFORE", "AFTER"):
+        for e in node.get("events") or []:
+            _required_leaves(e, out)
+    return out
+
+
+def _conjunctive_leaves(node: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Leaves of a pure AND-of-events group, or None if it has any other structure."""
+    op = node.get("operator")
+    if op is None:
+        return [node] if node.get("event_type") != "date" else None
+    if str(op).upper() != "AND":
+        return None
+    leaves: List[Dict[str, Any]] = []
+    for e in node.get("events") or []:
+        sub = _conjunctive_leaves(e)
+        if sub is None:
+            return None
+        leaves.extend(sub)
+    return leaves
+
+
+@dataclass
+class DeltaPlan:
+    """How to evaluate `study` from the materialized person set of `baseline`."""
+    baseline: Dict[str, Any]
+    study: Dict[str, Any]
+    extra_demographics: Dict[str, Any] = field(default_factory=dict)
+    extra_groups: List[Dict[str, Any]] = field(default_factory=list)
+    extra_exclusion: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_identity(self) -> bool:
+        """True when the study selects exactly the baseline persons."""
+        return not (self.extra_demographics or self.extra_groups or self.extra_exclusion)
+
+    def delta_criteria(self) -> Dict[str, Any]:
+        """The extra criteria alone, as a cohort definition dict."""
+        inc: Dict[str, Any] = {}
+        if self.extra_demographics:
+            inc["demographics"] = dict(self.extra_demographics)
+        if self.extra_groups:
+            inc["temporal_events"] = list(self.extra_groups)
+        out: Dict[str, Any] = {"inclusion_criteria": inc}
+        if self.extra_exclusion:
+            out["exclusion_criteria"] = self.extra_exclusion
+        return out
+
+    def sql(self, baseline_table: str, restrict_scans: bool = True) -> str:
+        """
+        SQL selecting the study's persons from `baseline_table` (a person_id relation).
+        With `restrict_scans`, event scans are also semi-joined to the baseline.
+        """
+        if self.is_identity:
+            return f"SELECT person_id FROM {baseline_table}"
+        return compile_cohort(self.delta_criteria(), restrict_to=baseline_table,
+                              restrict_scans=restrict_scans)
+
+
+def find_delta(baseline, study) -> Optional[DeltaPlan]:
+    """Return a DeltaPlan when `study` is `baseline` plus extra criteria, else None."""
+    b, s = as_criteria_dict(baseline), as_criteria_dict(study)
+    b_inc, s_inc = b.get("inclusion_criteria") or {}, s.get("inclusion_criteria") or {}
+
+    demo = _demographics_delta(b_inc.get("demographics") or {}, s_inc.get("demographics") or {})
+    if demo is None:
+        return None
+
+    remaining = list(s_inc.get("temporal_events") or [])
+    keys = [freeze_node(g) for g in remaining]
+    implied_groups = []
+    for group in b_inc.get("temporal_events") or []:
+        k = freeze_node(group)
+        if k in keys:
+            i = keys.index(k)
+            del keys[i], remaining[i]
+        else:
+            implied_groups.append(group)
+    if implied_groups:
+        required: set = set()
+        for g in s_inc.get("temporal_events") or []:
+            _required_leaves(g, required)
+        for group in implied_groups:
+            leaves = _conjunctive_leaves(group)
+            if leaves is None or any(_leaf_key(ev) not in required for ev in leaves):
+                return None
+
+    b_exc, s_exc = b.get("exclusion_criteria"), s.get("exclusion_criteria")
+    if b_exc:
+        if freeze_node(b_exc) != freeze_node(s_exc or {}):
+            return None
+        extra_exc = None
+    else:
+        extra_exc = s_exc or None
+    return DeltaPlan(b, s, demo, remaining, extra_exc)
+
+
+def _size(d: Dict[str, Any]) -> int:
+    """Number of conjuncts: more conjuncts = more specific (planned later)."""
+    inc = d.get("inclusion_criteria") or {}
+    n = len([v for v in (inc.get("demographics") or {}).values() if v is not None])
+    n += len(inc.get("temporal_events") or [])
+    return n + (1 if d.get("exclusion_criteria") else 0)
+
+
+# ---------- Multi-cohort plan ----------
+@dataclass
+class PlanStep:
+    """One cohort to materialize, from scratch (delta is None) or from a baseline."""
+    name: str
+    table: str
+    criteria: Dict[str, Any]
+    baseline: Optional[str] = None
+    delta: Optional[DeltaPlan] = None
+    baseline_table: Optional[str] = None
+
+    def sql(self, restrict_scans: bool = True) -> str:
+        if self.delta is None:
+            return compile_cohort(self.criteria)
+        return self.delta.sql(self.baseline_table, restrict_scans=restrict_scans)
+
+
+@dataclass
+class PlanResult:
+    """Counts and wall-clock seconds per cohort from CohortPlan.execute()."""
+    counts: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    tables: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.seconds.values())
+
+
+@dataclass
+class CohortPlan:
+    """Ordered steps: baselines first, each study evaluated against its closest baseline."""
+    steps: List[PlanStep] = field(default_factory=list)
+
+    def explain(self) -> str:
+        lines = []
+        for st in self.steps:
+            if st.delta is None:
+                lines.append(f"{st.name}: full evaluation")
+            elif st.delta.is_identity:
+                lines.append(f"{st.name}: same persons as {st.baseline}")
+            else:
+                parts = []
+                if st.delta.extra_demographics:
+                    parts.append(f"demographics {st.delta.extra_demographics}")
+                if st.delta.extra_groups:
+                    parts.append(f"{len(st.delta.extra_groups)} temporal group(s)")
+                if st.delta.extra_exclusion:
+                    parts.append("exclusion criteria")
+                lines.append(f"{st.name}: {st.baseline} + " + ", ".join(parts))
+        return "\n".join(lines)
+
+    def execute(self, con, keep_tables: bool = True) -> PlanResult:
+        """Materialize every step as a TEMP table on `con` (a DuckDB connection)."""
+        result = PlanResult()
+        total = int(con.execute("SELECT count(*) FROM person").fetchone()[0]) or 1
+        for st in self.steps:
+            t0 = time.perf_counter()
+            restrict = True
+            if st.baseline is not None:
+                restrict = result.counts[st.baseline] / total <= SCAN_RESTRICT_MAX_SHARE
+            con.execute(f"CREATE OR REPLACE TEMP TABLE {st.table} AS {st.sql(restrict_scans=restrict)}")
+            result.seconds[st.name] = time.perf_counter() - t0
+            result.counts[st.name] = int(con.execute(f"SELECT count(*) FROM {st.table}").fetchone()[0])
+            result.tables[st.name] = st.table
+        if not keep_tables:
+            for st in self.steps:
+                con.execute(f"DROP TABLE IF EXISTS {st.table}")
+            result.tables = {}
+        return result
+
+
+def _named(cohorts: Union[Mapping[str, Any], Sequence[Any]]) -> List[Any]:
+    """(name, definition) pairs; a plain sequence is named by position."""
+    if isinstance(cohorts, Mapping):
+        return list(cohorts.items())
+    return [(f"cohort{i}", c) for i, c in enumerate(cohorts)]
+
+
+def plan_cohorts(cohorts: Union[Mapping[str, Any], Sequence[Any]]) -> CohortPlan:
+    """
+    Plan a set of cohorts (name -> definition, or a list named by position).
+    Each cohort is evaluated against the most specific earlier cohort it refines.
+    """
+    dicts = [(name, as_criteria_dict(c)) for name, c in _named(cohorts)]
+    order = sorted(range(len(dicts)), key=lambda i: (_size(dicts[i][1]), i))
+
+    plan = CohortPlan()
+    planned: List[PlanStep] = []
+    for i in order:
+        name, d = dicts[i]
+        step = PlanStep(name=name, table=f"_cohort_{i}", criteria=d)
+        best: Optional[PlanStep] = None
+        for cand in planned:
+            delta = find_delta(cand.criteria, d)
+            if delta is None:
+                continue
+            if best is None or _size(cand.criteria) > _size(best.criteria):
+                best, step.delta = cand, delta
+        if best is not None:
+            step.baseline, step.baseline_table = best.name, best.table
+        planned.append(step)
+    plan.steps = planned
+    return plan
+
+
+def compare_with_scratch(con, cohorts: Union[Mapping[str, Any], Sequence[Any]],
+                         repeat: int = 1) -> Dict[str, Any]:
+    """
+    Measure the work saved by delta planning on `con`: run every cohort from
+    scratch, then the planned version, check both agree and report timings.
+    """
+    plan = plan_cohorts(cohorts)
+    scratch: Dict[str, float] = {}
+    scratch_counts: Dict[str, int] = {}
+    planned_total = float("inf")
+    for _ in range(max(1, repeat)):
+        for st in plan.steps:
+            t0 = time.perf_counter()
+            n = con.execute(f"SELECT count(*) FROM ({compile_cohort(st.criteria)})").fetchone()[0]
+            scratch[st.name] = min(scratch.get(st.name, float("inf")), time.perf_counter() - t0)
+            scratch_counts[st.name] = int(n)
+        res = plan.execute(con, keep_tables=False)
+        planned_total = min(planned_total, res.total_seconds)
+    mismatched = [n for n in scratch_counts if scratch_counts[n] != res.counts[n]]
+    if mismatched:
+        raise AssertionError(f"Delta plan disagrees with full evaluation for: {mismatched}")
+    scratch_total = sum(scratch.values())
+    return {
+        "plan": plan.explain(),
+        "counts": res.counts,
+        "scratch_seconds": scratch_total,
+        "planned_seconds": planned_total,
+        "speedup": scratch_total / planned_total if planned_total else float("inf"),
+    }
+
+
+# ---------- Shared-scan evaluation ----------
+def run_cohorts_shared(con, cohorts: Union[Mapping[str, Any], Sequence[Any]]) -> Dict[str, List[int]]:
+    """Evaluate all cohorts in one shared-scan query on `con`; name -> person ids."""
+    items = _named(cohorts)
+    sql = compile_cohorts([c for _, c in items])
+    lists = ", ".join(
+        f"coalesce(list(person_id ORDER BY person_id) FILTER (WHERE c{i}), [])" for i in range(len(items))
+    )
+    row = con.execute(f"SELECT {lists} FROM ({sql})").fetchone()
+    return {name: list(row[i]) for i, (name, _) in enumerate(items)}
+
+
+def compare_shared_scan(con, cohorts: Union[Mapping[str, Any], Sequence[Any]],
+                        repeat: int = 1) -> Dict[str, Any]:
+    """
+    Measure shared-scan evaluation on `con` against running every cohort on its
+    own; both return each cohort's persons, which must agree.
+    """
+    items = _named(cohorts)
+    separate_total = shared_total = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        separate = {
+            name: list(con.execute(
+                f"SELECT coalesce(list(person_id ORDER BY person_id), []) FROM ({compile_cohort(c)})"
+            ).fetchone()[0])
+            for name, c in items
+        }
+        separate_total = min(separate_total, time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        shared = run_cohorts_shared(con, dict(items))
+        shared_total = min(shared_total, time.perf_counter() - t0)
+    mismatched = [name for name in separate if separate[name] != shared[name]]
+    if mismatched:
+        raise AssertionError(f"Shared-scan evaluation disagrees with separate runs for: {mismatched}")
+    return {
+        "counts": {name: len(p) for name, p in shared.items()},
+        "separate_seconds": separate_total,
+        "shared_seconds": shared_total,
+        "speedup": separate_total / shared_total if shared_total else float("inf"),
+    }
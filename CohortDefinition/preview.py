@@ -0,0 +1,211 @@
+# preview.py
+"""
+Sampled preview: approximate cohort sizes in seconds from a prebuilt person sample.
+
+    sample = SampledExtract.build("synpuf_100k_omop_54.duckdb", "synpuf.sample.duckdb")  # once
+    sample = SampledExtract.open("synpuf.sample.duckdb")                                 # reused
+    print(sample.preview(cohort, rate=0.01))
+    # ~12,340 persons (95% CI 11,650-13,060), 1.0% sample, 0.04s
+    for est in sample.refine(cohort, target_relative_width=0.05):
+        print(est)                      # 1% -> 5% -> 10% ..., stops once precise enough
+
+The sample file holds every OMOP table restricted to persons whose
+`sharding.person_hash` falls below `max_rate` of its range. A rate-r preview keeps
+the persons below r of that range, so samples are nested: refining to a
+larger rate only adds persons, and the same person is always in or out.
+
+Counts are extrapolated with the ratio k / n * N (k cohort persons among n
+sampled, N persons in the full extract). The interval is a Wilson score
+interval with a finite-population correction, clipped to what the sample
+already proves (at least k, at most N - (n - k)). Definitions are compiled
+with sql.py. Requires: pip install duckdb
+"""
+
+import math
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+from CohortDefinition.omop import OMOP_TABLES, Source, attach_source, connect, require_duckdb
+from CohortDefinition.sharding import HASH_SPACE, person_hash_sql
+from CohortDefinition.sql import compile_cohort
+
+DEFAULT_MAX_RATE = 0.10
+DEFAULT_RATES = (0.01, 0.05, 0.10)
+_INFO_TABLE = "_sample_info"
+_Z = {0.80: 1.2816, 0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+def _source_stamp(source: Source) -> str:
+    """Cheap change detector for a source: size and mtime of its files."""
+    root = Path(source)
+    files = sorted(root.rglob("*.parquet")) if root.is_dir() else [root]
+    return ";".join(f"{f.stat().st_size}:{f.stat().st_mtime_ns}" for f in files)
+
+
+def _sample_filter(rate: float) -> str:
+    return f"{person_hash_sql()} < {int(round(rate * HASH_SPACE))}"
+
+
+# ---------- Estimates ----------
+@dataclass
+class PreviewEstimate:
+    """Extrapolated cohort size from a `rate` sample (exact when rate == 1)."""
+    rate: float
+    sample_persons: int  # n: persons in the sample
+    sample_count: int  # k: of which in the cohort
+    persons: float  # extrapolated cohort size
+    low: float
+    high: float
+    confidence: float
+    seconds: float
+    exact: bool = False
+
+    @property
+    def relative_width(self) -> float:
+        """CI width relative to the estimate (inf for an empty estimate)."""
+        return (self.high - self.low) / self.persons if self.persons else math.inf
+
+    def __str__(self) -> str:
+        if self.exact:
+            return f"{self.persons:,.0f} persons (exact), {self.seconds:.2f}s"
+        return (f"~{self.persons:,.0f} persons ({self.confidence:.0%} CI {self.low:,.0f}-{self.high:,.0f}), "
+                f"{self.rate:.1%} sample, {self.seconds:.2f}s")
+
+
+def extrapolate(k: int, n: int, population: int, confidence: float = 0.95) -> Dict[str, float]:
+    """Ratio estimate and Wilson interval (with finite-population correction) for k of n sampled."""
+    if n <= 0:
+        return {"persons": 0.0, "low": 0.0, "high": float(population)}
+    z = _Z.get(round(confidence, 2))
+    if z is None:
+        raise ValueError(f"Unsupported confidence {confidence}; use one of {sorted(_Z)}.")
+    if population > 1:
+        z *= math.sqrt(max(population - n, 0) / (population - 1))
+    p = k / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return {
+        "persons": p * population,
+        "low": max((center - half) * population, float(k)),
+        "high": min((center + half) * population, float(population - (n - k))),
+    }
+
+
+# ---------- Sample ----------
+class SampledExtract:
+    """A prebuilt person-hash sample of a local OMOP extract (one DuckDB file)."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.con = connect(self.path)
+        row = self.con.execute(f"SELECT source, stamp, max_rate, persons FROM {_INFO_TABLE}").fetchone()
+        self.source, self.stamp, self.max_rate, self.population = row[0], row[1], float(row[2]), int(row[3])
+        self._sample_persons: Dict[float, int] = {}
+
+    @classmethod
+    def build(cls, source: Source, path: Union[str, Path], max_rate: float = DEFAULT_MAX_RATE,
+              overwrite: bool = False) -> "SampledExtract":
+        """
+        Write the sample of `source` to `path`, unless a sample built from the same,
+        unchanged source with at least `max_rate` is already there (then reuse it).
+        """
+        if not 0 < max_rate <= 1:
+            raise ValueError(f"max_rate must be in (0, 1], got {max_rate}.")
+        path = Path(path)
+        stamp = _source_stamp(source)
+        if path.exists() and not overwrite:
+            existing = cls(path)
+            if existing.stamp == stamp and existing.max_rate >= max_rate \
+                    and existing.source == str(Path(source).resolve()):
+                return existing
+            existing.close()
+        duckdb = require_duckdb()
+        tmp = path.with_name(path.name + ".tmp")
+        if tmp.exists():
+            tmp.unlink()
+        con = duckdb.connect(str(tmp))
+        try:
+            relations = attach_source(con, source)
+            if "person" not in relations:
+                raise ValueError(f"OMOP source {source!s} has no person table.")
+            where = _sample_filter(max_rate)
+            for table in OMOP_TABLES:
+                if table in relations:
+                    con.execute(f"CREATE TABLE {table} AS SELECT * FROM {relations[table]} WHERE {where}")
+            persons = con.execute(f"SELECT count(*) FROM {relations['person']}").fetchone()[0]
+            con.execute(f"CREATE TABLE {_INFO_TABLE} (source VARCHAR, stamp VARCHAR, "
+                        f"max_rate DOUBLE, persons BIGINT)")
+            con.execute(f"INSERT INTO {_INFO_TABLE} VALUES (?, ?, ?, ?)",
+                        [str(Path(source).resolve()), stamp, float(max_rate), int(persons)])
+        finally:
+            con.close()
+        os.replace(tmp, path)
+        return cls(path)
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "SampledExtract":
+        return cls(path)
+
+    def close(self) -> None:
+        self.con.close()
+
+    def __enter__(self) -> "SampledExtract":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ----------------- Previews -----------------
+    def sample_persons(self, rate: float) -> int:
+        """Number of persons in the `rate` sample."""
+        n = self._sample_persons.get(rate)
+        if n is None:
+            n = self._sample_persons[rate] = int(self.con.execute(
+                f"SELECT count(*) FROM person WHERE {_sample_filter(rate)}").fetchone()[0])
+        return n
+
+    def preview(self, criteria, rate: float = 0.01, confidence: float = 0.95) -> PreviewEstimate:
+        """
+        Extrapolated size of the cohort from the `rate` sample (rate <= max_rate).
+        rate=1 counts exactly on the full source the sample was built from.
+        """
+        t0 = time.perf_counter()
+        if rate >= 1:
+            con = connect(self.source)
+            try:
+                k = int(con.execute(f"SELECT count(*) FROM ({compile_cohort(criteria)})").fetchone()[0])
+            finally:
+                con.close()
+            return PreviewEstimate(rate=1.0, sample_persons=self.population, sample_count=k, persons=float(k),
+                                   low=float(k), high=float(k), confidence=1.0,
+                                   seconds=time.perf_counter() - t0, exact=True)
+        if not 0 < rate <= self.max_rate:
+            raise ValueError(f"rate must be in (0, {self.max_rate}] for this sample (or 1 for exact), got {rate}.")
+        person_filter = None if rate == self.max_rate else _sample_filter(rate)
+        sql = compile_cohort(criteria, person_filter=person_filter)
+        k = int(self.con.execute(f"SELECT count(*) FROM ({sql})").fetchone()[0])
+        n = self.sample_persons(rate)
+        est = extrapolate(k, n, self.population, confidence)
+        return PreviewEstimate(rate=rate, sample_persons=n, sample_count=k, confidence=confidence,
+                               seconds=time.perf_counter() - t0, **est)
+
+    def refine(self, criteria, rates: Optional[Sequence[float]] = None,
+               target_relative_width: Optional[float] = None, exact: bool = False,
+               confidence: float = 0.95) -> Iterator[PreviewEstimate]:
+        """
+        Yield previews at increasing rates (default 1%, 5%, ... up to max_rate, then
+        the exact count if `exact`), stopping once the CI is narrower than
+        `target_relative_width` of the estimate.
+        """
+        if rates is None:
+            rates = [r for r in DEFAULT_RATES if r < self.max_rate] + [self.max_rate]
+        steps = sorted(set(rates)) + ([1.0] if exact else [])
+        for rate in steps:
+            est = self.preview(criteria, rate=rate, confidence=confidence)
+            yield est
+            if est.exact or (target_relative_width is not None and est.relative_width <= target_relative_width):
+                return
@@ -0,0 +1,315 @@
+# sharding.py
+"""
+Split one cohort definition into disjoint shards, run them in parallel, merge the persons.
+
+    catalog = StatisticsCatalog.load("synpuf_stats.json")
+    shards = shard_cohort(cohort, 8, catalog=catalog)
+    result = run_sharded(shards, DuckDBRunner("synpuf_100k_omop_54.duckdb"))
+    result.persons                      # set of person_id
+    print(result.summary())
+
+Two ways to split:
+- "demographics": gender x birth-year bands. Each shard is an ordinary cohort
+  definition whose demographics are narrowed to its band, so any runner that
+  accepts a cohort (BiasAnalyzer included) can execute it. Band boundaries are
+  quantiles of the catalog's birth-year counts, so estimated shard sizes balance.
+  Only exact when the bands cover every person the cohort can select: the
+  catalog must show no person without a birth year (unless the cohort already
+  restricts birth years) and, to split on gender, only male and female persons.
+- "hash": contiguous ranges of a deterministic person-id hash (`person_bucket`).
+  Always exact and evenly sized, but the runner must filter on person_id
+  (`Shard.sql()` / `Shard.contains()`).
+
+`by="auto"` (the default) splits on demographics when that is exact, else on hashes.
+"""
+
+import copy
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from CohortDefinition.builder import CohortCriteria, Demographics, as_criteria_dict
+from CohortDefinition.omop import GENDER_CONCEPTS, Source, connect
+from CohortDefinition.sql import compile_cohort, demographics_predicate
+
+# person_hash(): a multiplicative hash of person_id into [0, HASH_SPACE), portable to
+# any SQL engine; person_bucket() splits that range into HASH_BUCKETS equal ranges
+HASH_SPACE = 2 ** 31
+HASH_BUCKETS = 1024
+_HASH_MULTIPLIER = 2654435761
+
+
+def person_hash(person_id: int) -> int:
+    """Deterministic, evenly spread hash of a person id in [0, HASH_SPACE); matches `person_hash_sql`."""
+    return (int(person_id) % HASH_SPACE) * _HASH_MULTIPLIER % HASH_SPACE
+
+
+def person_hash_sql(column: str = "person_id") -> str:
+    """SQL expression for person_hash(column). Stays within BIGINT arithmetic."""
+    return f"((({column} % {HASH_SPACE}) * {_HASH_MULTIPLIER}) % {HASH_SPACE})"
+
+
+def person_bucket(person_id: int) -> int:
+    """Hash bucket (0 .. HASH_BUCKETS - 1) of a person; matches `hash_filter_sql`."""
+    return person_hash(person_id) // (HASH_SPACE // HASH_BUCKETS)
+
+
+def hash_filter_sql(lo: int, hi: int, column: str = "person_id") -> str:
+    """SQL predicate: person_bucket(column) in [lo, hi)."""
+    return f"{person_hash_sql(column)} // {HASH_SPACE // HASH_BUCKETS} BETWEEN {int(lo)} AND {int(hi) - 1}"
+
+
+# ---------- Shards ----------
+@dataclass
+class Shard:
+    """One disjoint slice of a cohort."""
+    index: int
+    criteria: Any  # CohortCriteria (or dict) restricted to this shard's demographics
+    gender: Optional[str] = None
+    min_birth_year: Optional[int] = None
+    max_birth_year: Optional[int] = None
+    buckets: Optional[Tuple[int, int]] = None  # [lo, hi) of person_bucket, hash shards only
+    estimated_persons: Optional[float] = None
+
+    @property
+    def person_filter(self) -> Optional[str]:
+        """Predicate a runner must add on person_id (None for demographic shards)."""
+        if self.buckets is None:
+            return None
+        return hash_filter_sql(*self.buckets)
+
+    def contains(self, person_id: int) -> bool:
+        """Whether a person can belong to this shard (hash shards only check the bucket)."""
+        return self.buckets is None or self.buckets[0] <= person_bucket(person_id) < self.buckets[1]
+
+    def sql(self) -> str:
+        """Local DuckDB SQL for this shard (see sql.py); event scans are restricted to the shard."""
+        person_filter = self.person_filter
+        if person_filter is None:
+            demo = demographics_predicate(self._demographics(), alias="s")
+            if demo:
+                person_filter = f"person_id IN (SELECT s.person_id FROM person s WHERE {demo})"
+        return compile_cohort(self.criteria, person_filter=person_filter)
+
+    def describe(self) -> str:
+        if self.buckets is not None:
+            return f"buckets {self.buckets[0]}-{self.buckets[1] - 1}"
+        lo = "" if self.min_birth_year is None else self.min_birth_year
+        hi = "" if self.max_birth_year is None else self.max_birth_year
+        return f"{self.gender or 'any'}, born {lo}..{hi}"
+
+    def _demographics(self) -> Dict[str, Any]:
+        return {"gender": self.gender, "min_birth_year": self.min_birth_year,
+                "max_birth_year": self.max_birth_year}
+
+
+def _with_demographics(criteria, demo: Dict[str, Any]):
+    """Copy of `criteria` whose inclusion demographics are replaced by `demo`."""
+    if isinstance(criteria, CohortCriteria):
+        c = copy.deepcopy(criteria)
+        c.demographics = Demographics(**demo)
+        return c
+    d = copy.deepcopy(as_criteria_dict(criteria))
+    ic = d.setdefault("inclusion_criteria", {})
+    ic["demographics"] = Demographics(**demo).to_yaml()
+    return d
+
+
+def _allocate(total: int, weights: Dict[Any, float]) -> Dict[Any, int]:
+    """Split `total` into integer shares >= 1 proportional to weights (largest remainder)."""
+    keys = sorted(weights, key=lambda k: -weights[k])
+    norm = sum(weights.values()) or 1.0
+    raw = {k: max(total * weights[k] / norm, 1.0) for k in keys}
+    out = {k: int(raw[k]) for k in keys}
+    for k in sorted(keys, key=lambda k: out[k] - raw[k]):
+        if sum(out.values()) >= total:
+            break
+        out[k] += 1
+    return out
+
+
+def _year_bands(counts: Dict[int, int], lo: Optional[int], hi: Optional[int],
+                k: int) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Contiguous birth-year bands covering [lo, hi] with near-equal person counts."""
+    years = sorted(y for y in counts if (lo is None or y >= lo) and (hi is None or y <= hi))
+    k = min(k, len(years))
+    if k <= 1:
+        return [(lo, hi)]
+    total = float(sum(counts[y] for y in years))
+    starts: List[int] = []
+    acc = 0.0
+    for i, y in enumerate(years):
+        band = len(starts) + 1
+        # Start a new band at y when its midpoint passes the band's target share,
+        # keeping at least one year for each band still to come
+        if i and band < k and acc + counts[y] / 2.0 > band * total / k and len(years) - i >= k - band:
+            starts.append(y)
+        acc += counts[y]
+    bounds = [lo] + starts
+    return [(b, (starts[j] - 1) if j < len(starts) else hi) for j, b in enumerate(bounds)]
+
+
+def _birth_year_blocker(catalog, demo: Dict[str, Any]) -> Optional[str]:
+    """Why birth-year bands would miss persons of the cohort (None if they would not)."""
+    if catalog is None:
+        return "no StatisticsCatalog to place birth-year bands"
+    restricts_years = demo.get("min_birth_year") is not None or demo.get("max_birth_year") is not None
+    if not restricts_years and sum(catalog.birth_year_counts.values()) < catalog.persons:
+        return "some persons have no year_of_birth"
+    return None
+
+
+def _genders_cover(catalog) -> bool:
+    """Whether every person is male or female, so a gender split loses nobody."""
+    return (not set(catalog.gender_counts) - set(GENDER_CONCEPTS.values())
+            and sum(catalog.gender_counts.values()) >= catalog.persons)
+
+
+def shard_cohort(criteria, n_shards: int, catalog=None, by: str = "auto") -> List[Shard]:
+    """
+    Split `criteria` into about `n_shards` disjoint shards whose union is the cohort.
+
+    `catalog` (a stats.StatisticsCatalog) places birth-year boundaries and fills
+    `Shard.estimated_persons`; demographic sharding requires it. `by` is
+    "auto", "demographics" or "hash".
+    """
+    if by not in ("auto", "demographics", "hash"):
+        raise ValueError(f"Unsupported sharding {by!r}; use 'auto', 'demographics' or 'hash'.")
+    n_shards = max(int(n_shards), 1)
+    estimator = None
+    if catalog is not None:
+        from CohortDefinition.stats import CardinalityEstimator
+        estimator = CardinalityEstimator(catalog)
+    demo = dict((as_criteria_dict(criteria).get("inclusion_criteria") or {}).get("demographics") or {})
+
+    if by != "hash" and n_shards > 1:
+        blocker = _birth_year_blocker(catalog, demo)
+        if blocker is None:
+            split_gender = not demo.get("gender") and _genders_cover(catalog)
+            return _demographic_shards(criteria, n_shards, catalog, estimator, demo, split_gender)
+        if by == "demographics":
+            raise ValueError(f"Demographic shards would not cover the cohort: {blocker}.")
+
+    if n_shards > HASH_BUCKETS:
+        raise ValueError(f"At most {HASH_BUCKETS} hash shards are supported, got {n_shards}.")
+    total = estimator.estimate(criteria).persons if estimator else None
+    shards = []
+    for i in range(n_shards):
+        lo, hi = i * HASH_BUCKETS // n_shards, (i + 1) * HASH_BUCKETS // n_shards
+        shards.append(Shard(
+            index=i, criteria=criteria, gender=demo.get("gender"),
+            min_birth_year=demo.get("min_birth_year"), max_birth_year=demo.get("max_birth_year"),
+            buckets=(lo, hi),
+            estimated_persons=None if total is None else total * (hi - lo) / HASH_BUCKETS,
+        ))
+    return shards
+
+
+def _demographic_shards(criteria, n_shards: int, catalog, estimator, demo: Dict[str, Any],
+                        split_gender: bool) -> List[Shard]:
+    if split_gender:
+        by_name = {g: catalog.gender_counts.get(cid, 0) for g, cid in GENDER_CONCEPTS.items()}
+        genders = _allocate(n_shards, {g: float(n) for g, n in by_name.items() if n})
+    else:
+        genders = {demo.get("gender"): n_shards}
+    shards: List[Shard] = []
+    for gender, k in genders.items():
+        for lo, hi in _year_bands(catalog.birth_year_counts, demo.get("min_birth_year"),
+                                  demo.get("max_birth_year"), k):
+            band = {"gender": gender, "min_birth_year": lo, "max_birth_year": hi}
+            sub = _with_demographics(criteria, band)
+            shards.append(Shard(index=len(shards), criteria=sub, **band,
+                                estimated_persons=estimator.estimate(sub).persons))
+    return shards
+
+
+# ---------- Execution ----------
+@dataclass
+class ShardRun:
+    shard: Shard
+    persons: int
+    seconds: float
+
+
+@dataclass
+class ShardedResult:
+    """Merged persons of all shards plus per-shard timings."""
+    persons: Set[int] = field(default_factory=set)
+    runs: List[ShardRun] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        lines = [f"{len(self.persons)} persons from {len(self.runs)} shards in {self.seconds:.3f}s"]
+        for r in sorted(self.runs, key=lambda r: r.shard.index):
+            est = "" if r.shard.estimated_persons is None else f" (est. {r.shard.estimated_persons:.0f})"
+            lines.append(f"  [{r.shard.index}] {r.shard.describe()}: {r.persons}{est} in {r.seconds:.3f}s")
+        return "\n".join(lines)
+
+
+def _timed_run(runner: Callable[[Shard], Iterable[int]], shard: Shard) -> Tuple[List[int], float]:
+    t0 = time.perf_counter()
+    persons = list(runner(shard))
+    return persons, time.perf_counter() - t0
+
+
+def run_sharded(criteria: Union[Any, Sequence[Shard]], runner: Callable[[Shard], Iterable[int]],
+                n_shards: Optional[int] = None, catalog=None, by: str = "auto",
+                max_workers: Optional[int] = None, executor: Optional[Executor] = None) -> ShardedResult:
+    """
+    Run every shard through `runner(shard) -> person ids` in parallel and merge the results.
+
+    `criteria` is a cohort definition (sharded with `shard_cohort(criteria, n_shards,
+    catalog, by)`; n_shards defaults to the CPU count) or a list of shards.
+    Shards run largest-estimate first on a thread pool, or on `executor` if given
+    (a ProcessPoolExecutor needs a picklable runner, e.g. DuckDBRunner).
+    """
+    if isinstance(criteria, (list, tuple)) and criteria and all(isinstance(s, Shard) for s in criteria):
+        shards = list(criteria)
+    else:
+        shards = shard_cohort(criteria, n_shards or os.cpu_count() or 1, catalog=catalog, by=by)
+    order = sorted(shards, key=lambda s: -(s.estimated_persons or 0.0))
+    result = ShardedResult()
+    t0 = time.perf_counter()
+    pool = executor or ThreadPoolExecutor(max_workers=max_workers or min(len(shards), os.cpu_count() or 1))
+    try:
+        futures = {pool.submit(_timed_run, runner, s): s for s in order}
+        for fut in as_completed(futures):
+            persons, seconds = fut.result()
+            result.persons.update(persons)
+            result.runs.append(ShardRun(shard=futures[fut], persons=len(persons), seconds=seconds))
+    finally:
+        if executor is None:
+            pool.shutdown(wait=True)
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+class DuckDBRunner:
+    """
+    Runner executing `Shard.sql()` on a local OMOP extract (DuckDB file or Parquet
+    directory). One connection per process, one cursor per call; picklable.
+    """
+
+    def __init__(self, source: Source):
+        self.source = source
+        self._con = None
+        self._lock = threading.Lock()
+
+    def __call__(self, shard: Shard) -> List[int]:
+        with self._lock:
+            if self._con is None:
+                self._con = connect(self.source)
+        cur = self._con.cursor()
+        try:
+            return [r[0] for r in cur.execute(shard.sql()).fetchall()]
+        finally:
+            cur.close()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"source": self.source}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["source"])
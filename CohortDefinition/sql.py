@@ -0,0 +1,306 @@
+# sql.py
+"""
+Compile cohort definitions to DuckDB SQL over a local OMOP extract.
+
+This is a local re-implementation of the cohort semantics, used to plan,
+preview and benchmark definitions without a BiasAnalyzer round trip:
+
+    sql = compile_cohort(cohort)                  # SELECT person_id FROM ...
+    con = CohortDefinition.omop.connect("synthetic.duckdb")
+    persons = con.execute(sql).fetchall()
+
+Every temporal node compiles to a relation of (person_id, start_date, end_date):
+- Event leaf: rows of its domain table (optionally one concept), dated by the
+  table's start date shifted by `offset` days. `event_instance=k` keeps the
+  k-th occurrence per person (k < 0 counts from the last one).
+- Date leaf: only meaningful inside BEFORE, where it becomes a date filter.
+- OR(a, b): all rows of a and b.
+- AND(a, b): persons in both; one row spanning their earliest start and latest end.
+- NOT(x): persons without x; dates are NULL, so NOT cannot be ordered by BEFORE.
+- BEFORE(a, b): for each b row with some a row ending strictly before it (and,
+  with `interval` [lo, hi], lo <= days between them <= hi): one row from the
+  earliest such a start to that b end. Nested BEFOREs therefore chain.
+
+Top-level temporal groups are ANDed with the demographics; persons meeting the
+whole exclusion section (its demographics and all its groups) are removed.
+Identical sub-trees are compiled once, as shared CTEs.
+
+`compile_cohorts([...])` compiles several definitions into one query that
+scans each event table once (only the concepts any of them uses) and returns
+one membership column per cohort.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from CohortDefinition.builder import as_criteria_dict, freeze_node
+from CohortDefinition.omop import DOMAIN_TABLES, GENDER_CONCEPTS
+
+# Event fields that the local compiler cannot evaluate faithfully
+_UNSUPPORTED_EVENT_FIELDS = ("code", "code_type", "value_filter", "qualifiers")
+
+
+def _date_literal(value: Any) -> str:
+    return f"DATE '{str(value)[:10]}'"
+
+
+def demographics_predicate(demo: Optional[Dict[str, Any]], alias: str = "p") -> Optional[str]:
+    """SQL predicate over the person table for a demographics dict (None if unrestricted)."""
+    if not demo:
+        return None
+    preds: List[str] = []
+    gender = demo.get("gender")
+    if gender:
+        gid = GENDER_CONCEPTS.get(str(gender).lower())
+        if gid is None:
+            raise ValueError(f"Unsupported gender {gender!r}; use 'male' or 'female'.")
+        preds.append(f"{alias}.gender_concept_id = {gid}")
+    if demo.get("min_birth_year") is not None:
+        preds.append(f"{alias}.year_of_birth >= {int(demo['min_birth_year'])}")
+    if demo.get("max_birth_year") is not None:
+        preds.append(f"{alias}.year_of_birth <= {int(demo['max_birth_year'])}")
+    return " AND ".join(preds) if preds else None
+
+
+class CohortCompiler:
+    """
+    Accumulates CTEs for one or more cohort definitions.
+
+    `restrict_to` names a relation with a person_id column (e.g. a materialized
+    baseline); the person universe is then limited to it and, unless
+    `restrict_scans` is False, so is every event scan (a semi-join that pays
+    off when the relation is small compared with the person table).
+
+    `person_filter` is a SQL predicate over an unqualified `person_id` column
+    (e.g. a hash range, see `sharding.py`); it is applied to the universe and
+    to every event scan.
+
+    With `shared_scans`, leaves read from one scan per domain table, restricted
+    to the union of the concepts all compiled leaves use.
+    """
+
+    def __init__(self, restrict_to: Optional[str] = None, prefix: str = "n",
+                 restrict_scans: bool = True, person_filter: Optional[str] = None,
+                 shared_scans: bool = False):
+        self.restrict_to = restrict_to
+        self.restrict_scans = restrict_scans
+        self.person_filter = person_filter
+        self.shared_scans = shared_scans
+        self.prefix = prefix
+        self.ctes: List[Tuple[str, str]] = []
+        self._names: Dict[Any, str] = {}
+        self._scan_concepts: Dict[str, Optional[set]] = {}  # domain -> concepts (None = all rows)
+
+    # ----------------- Universe -----------------
+    def person_universe(self) -> str:
+        """Relation of candidate persons (person table, optionally restricted)."""
+        where = f" WHERE {self.person_filter}" if self.person_filter else ""
+        if self.restrict_to:
+            return f"(SELECT person_id FROM {self.restrict_to}{where})"
+        return f"(SELECT person_id FROM person{where})"
+
+    def _restrict(self, column: str = "person_id") -> str:
+        sql = f" AND ({self.person_filter})" if self.person_filter else ""
+        if self.restrict_to and self.restrict_scans:
+            sql += f" AND {column} IN (SELECT person_id FROM {self.restrict_to})"
+        return sql
+
+    # ----------------- Nodes -----------------
+    def node(self, node: Dict[str, Any]) -> str:
+        """Return the CTE name holding (person_id, start_date, end_date) for `node`."""
+        key = freeze_node(node)
+        name = self._names.get(key)
+        if name is None:
+            body = self._compile(node)
+            name = f"{self.prefix}{len(self.ctes)}"
+            self.ctes.append((name, body))
+            self._names[key] = name
+        return name
+
+    def _compile(self, node: Dict[str, Any]) -> str:
+        op = node.get("operator")
+        if op is None:
+            return self._leaf(node)
+        op = str(op).upper()
+        events = node.get("events") or []
+        if op == "OR":
+            return " UNION ALL ".join(
+                f"SELECT person_id, start_date, end_date FROM {self.node(e)}" for e in events
+            )
+        if op == "AND":
+            parts = [self.node(e) for e in events]
+            aggs = [
+                f"(SELECT person_id, min(start_date) AS s, max(end_date) AS e FROM {p} GROUP BY person_id) t{i}"
+                for i, p in enumerate(parts)
+            ]
+            sql = f"SELECT t0.person_id, least({', '.join(f't{i}.s' for i in range(len(parts)))}) AS start_date, " \
+                  f"greatest({', '.join(f't{i}.e' for i in range(len(parts)))}) AS end_date FROM {aggs[0]}"
+            for i, agg in enumerate(aggs[1:], start=1):
+                sql += f" JOIN {agg} ON t{i}.person_id = t0.person_id"
+            return sql
+        if op == "NOT":
+            inner = self.node(events[0])
+            return (
+                f"SELECT u.person_id, NULL::DATE AS start_date, NULL::DATE AS end_date "
+                f"FROM {self.person_universe()} u ANTI JOIN {inner} x ON x.person_id = u.person_id"
+            )
+        if op in ("BEFORE", "AFTER"):
+            if len(events) != 2:
+                raise ValueError(f"Operator {op!r} requires exactly 2 event(s), got {len(events)}.")
+            first, second = events if op == "BEFORE" else events[::-1]
+            return self._before(first, second, node.get("interval"))
+        raise ValueError(f"Unsupported operator: {op!r}")
+
+    def _leaf(self, ev: Dict[str, Any]) -> str:
+        event_type = str(ev.get("event_type", ""))
+        if event_type == "date":
+            # A bare date holds for everyone, on that date
+            d = _date_literal(ev.get("timestamp"))
+            return f"SELECT person_id, {d} AS start_date, {d} AS end_date FROM {self.person_universe()}"
+        if event_type not in DOMAIN_TABLES:
+            raise ValueError(f"Unsupported event_type: {event_type!r}")
+        for f in _UNSUPPORTED_EVENT_FIELDS:
+            if ev.get(f) is not None:
+                raise ValueError(f"{event_type}: field {f!r} is not supported by the local SQL compiler.")
+        concept_col, date_col = DOMAIN_TABLES[event_type]
+        concept = ev.get("event_concept_id")
+        concept = None if concept is None else int(concept)
+        if self.shared_scans:
+            source = self._scan(event_type, concept)
+            concept_col, date_col = "concept_id", "event_date"
+        else:
+            source = event_type
+        where = "TRUE"
+        if concept is not None:
+            where = f"{concept_col} = {concept}"
+        if not self.shared_scans:
+            where += self._restrict()
+        shift = f" + {int(ev['offset'])}" if ev.get("offset") else ""
+        k = ev.get("event_instance")
+        if k is None:
+            return (
+                f"SELECT person_id, {date_col}{shift} AS start_date, {date_col}{shift} AS end_date "
+                f"FROM {source} WHERE {where}"
+            )
+        k = int(k)
+        order = "DESC" if k < 0 else "ASC"
+        return (
+            f"SELECT person_id, d{shift} AS start_date, d{shift} AS end_date FROM ("
+            f"SELECT person_id, {date_col} AS d, row_number() OVER "
+            f"(PARTITION BY person_id ORDER BY {date_col} {order}) AS rn "
+            f"FROM {source} WHERE {where}) WHERE rn = {abs(k) or 1}"
+        )
+
+    def _scan(self, event_type: str, concept: Optional[int]) -> str:
+        """Name of the shared scan of `event_type`, widened to cover `concept`."""
+        concepts = self._scan_concepts.setdefault(event_type, set())
+        if concepts is not None:
+            if concept is None:
+                self._scan_concepts[event_type] = None
+            else:
+                concepts.add(concept)
+        return f"{self.prefix}_{event_type}"
+
+    def _scan_ctes(self) -> List[Tuple[str, str]]:
+        out = []
+        for event_type, concepts in self._scan_concepts.items():
+            concept_col, date_col = DOMAIN_TABLES[event_type]
+            where = "TRUE"
+            if concepts is not None:
+                where = f"{concept_col} IN ({', '.join(str(c) for c in sorted(concepts))})"
+            out.append((
+                f"{self.prefix}_{event_type}",
+                f"SELECT person_id, {concept_col} AS concept_id, {date_col} AS event_date "
+                f"FROM {event_type} WHERE {where}{self._restrict()}",
+            ))
+        return out
+
+    def _before(self, first: Dict[str, Any], second: Dict[str, Any], interval) -> str:
+        lo_hi = None
+        if interval:
+            lo_hi = (int(interval[0]), int(interval[1]))
+        # Fixed dates become filters on the other operand
+        if first.get("event_type") == "date" and second.get("event_type") != "date":
+            rel = self.node(second)
+            cond = f"start_date > {_date_literal(first.get('timestamp'))}"
+            if lo_hi:
+                cond += (f" AND date_diff('day', {_date_literal(first.get('timestamp'))}, start_date) "
+                         f"BETWEEN {lo_hi[0]} AND {lo_hi[1]}")
+            return f"SELECT person_id, start_date, end_date FROM {rel} WHERE {cond}"
+        if second.get("event_type") == "date" and first.get("event_type") != "date":
+            rel = self.node(first)
+            cond = f"end_date < {_date_literal(second.get('timestamp'))}"
+            if lo_hi:
+                cond += (f" AND date_diff('day', end_date, {_date_literal(second.get('timestamp'))}) "
+                         f"BETWEEN {lo_hi[0]} AND {lo_hi[1]}")
+            return f"SELECT person_id, start_date, end_date FROM {rel} WHERE {cond}"
+        a, b = self.node(first), self.node(second)
+        cond = "a.end_date < b.start_date"
+        if lo_hi:
+            cond += f" AND date_diff('day', a.end_date, b.start_date) BETWEEN {lo_hi[0]} AND {lo_hi[1]}"
+        return (
+            f"SELECT b.person_id, min(a.start_date) AS start_date, b.end_date AS end_date "
+            f"FROM {a} a JOIN {b} b ON a.person_id = b.person_id AND {cond} "
+            f"GROUP BY b.person_id, b.start_date, b.end_date"
+        )
+
+    # ----------------- Sections & cohorts -----------------
+    def section_predicate(self, section: Dict[str, Any], column: str = "p.person_id",
+                          alias: str = "p") -> str:
+        """Predicate (over a person-table alias) for one inclusion/exclusion section."""
+        preds: List[str] = []
+        demo = demographics_predicate(section.get("demographics"), alias=alias)
+        if demo:
+            preds.append(demo)
+        for group in section.get("temporal_events") or []:
+            preds.append(f"{column} IN (SELECT person_id FROM {self.node(group)})")
+        return " AND ".join(preds) if preds else "TRUE"
+
+    def cohort_predicate(self, criteria, alias: str = "p") -> str:
+        """Predicate selecting the cohort's persons from a person-table alias."""
+        d = as_criteria_dict(criteria)
+        pred = self.section_predicate(d.get("inclusion_criteria") or {}, f"{alias}.person_id", alias)
+        exc = d.get("exclusion_criteria")
+        if exc:
+            pred += f" AND NOT ({self.section_predicate(exc, f'{alias}.person_id', alias)})"
+        return pred
+
+    def with_clause(self) -> str:
+        # Scans come first; DuckDB materializes a CTE that is referenced more than once
+        ctes = self._scan_ctes() + self.ctes
+        if not ctes:
+            return ""
+        return "WITH " + ",\n".join(f"{name} AS ({body})" for name, body in ctes) + "\n"
+
+
+def compile_cohort(criteria, restrict_to: Optional[str] = None, restrict_scans: bool = True,
+                   person_filter: Optional[str] = None) -> str:
+    """
+    SQL returning the person_id of every person in the cohort (within `restrict_to`
+    and matching `person_filter`, if given).
+    """
+    comp = CohortCompiler(restrict_to=restrict_to, restrict_scans=restrict_scans,
+                          person_filter=person_filter)
+    pred = comp.cohort_predicate(criteria)
+    universe = f" AND p.person_id IN (SELECT person_id FROM {restrict_to})" if restrict_to else ""
+    if person_filter:
+        universe += f" AND ({person_filter})"
+    return f"{comp.with_clause()}SELECT p.person_id FROM person p WHERE {pred}{universe}"
+
+
+def compile_cohorts(criteria_list: Sequence[Any], restrict_to: Optional[str] = None) -> str:
+    """
+    One query evaluating several cohorts over shared event scans.
+
+    Returns rows (person_id, c0, c1, ...) for every person in at least one
+    cohort, where c<i> is true when the person belongs to criteria_list[i].
+    """
+    criteria_list = list(criteria_list)
+    if not criteria_list:
+        raise ValueError("compile_cohorts() needs at least one cohort definition.")
+    comp = CohortCompiler(restrict_to=restrict_to, shared_scans=True)
+    preds = [comp.cohort_predicate(c) for c in criteria_list]
+    cols = ", ".join(f"({pred}) AS c{i}" for i, pred in enumerate(preds))
+    universe = f" WHERE p.person_id IN (SELECT person_id FROM {restrict_to})" if restrict_to else ""
+    any_of = " OR ".join(f"c{i}" for i in range(len(preds)))
+    return (f"{comp.with_clause()}SELECT * FROM (SELECT p.person_id, {cols} FROM person p{universe}) "
+            f"WHERE {any_of}")
@@ -0,0 +1,347 @@
+# stats.py
+"""
+Cohort cardinality estimation from a local statistics catalog.
+
+Build a StatisticsCatalog once from a local OMOP extract (DuckDB file or
+Parquet directory), save it as JSON, then estimate how many persons each
+CohortCriteria selects without touching the database again:
+
+    catalog = StatisticsCatalog.build("synpuf_100k_omop_54.duckdb")
+    catalog.save("synpuf_stats.json")
+
+    est = CardinalityEstimator(StatisticsCatalog.load("synpuf_stats.json"))
+    est.estimate(cohort).persons
+    est.estimate_many(cohorts)        # thousands of definitions per second
+
+Estimates combine per-node selectivities under the independence assumptions
+documented on CardinalityEstimator. They are meant for ordering, sharding or
+dropping runs, not for reporting.
+"""
+
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from CohortDefinition.builder import as_criteria_dict, freeze_node
+from CohortDefinition.omop import (
+    DOMAIN_TABLES,
+    GENDER_CONCEPTS,
+    Source,
+    available_tables,
+    connect,
+)
+
+# event_instance values above this share the last histogram bucket
+EVENT_COUNT_CAP = 20
+
+
+# ---------- Catalog ----------
+@dataclass
+class DomainStats:
+    """Per-domain statistics for one OMOP event table."""
+    persons: int = 0  # persons with at least one event in the domain
+    concept_persons: Dict[int, int] = field(default_factory=dict)  # concept -> distinct persons
+    # k -> number of (person, concept) pairs with exactly k events (k capped at EVENT_COUNT_CAP)
+    event_counts: Dict[int, int] = field(default_factory=dict)
+    min_date: Optional[str] = None  # ISO dates spanning the domain's events
+    max_date: Optional[str] = None
+
+    def at_least_fraction(self, k: int) -> float:
+        """P(a person with the concept has >= k events of it), from event_counts."""
+        k = min(max(abs(int(k)), 1), EVENT_COUNT_CAP)
+        total = sum(self.event_counts.values())
+        if not total:
+            return 1.0 if k <= 1 else 0.0
+        return sum(n for c, n in self.event_counts.items() if c >= k) / total
+
+    def share_after(self, iso_date: str) -> float:
+        """Share of the domain's date window that falls after `iso_date` (linear)."""
+        if not self.min_date or not self.max_date:
+            return 0.5
+        lo = date.fromisoformat(self.min_date).toordinal()
+        hi = date.fromisoformat(self.max_date).toordinal()
+        t = date.fromisoformat(str(iso_date)[:10]).toordinal()
+        if hi <= lo:
+            return 1.0 if t < lo else 0.0
+        return min(max((hi - t) / (hi - lo), 0.0), 1.0)
+
+    def window_days(self) -> Optional[int]:
+        if not self.min_date or not self.max_date:
+            return None
+        return (date.fromisoformat(self.max_date) - date.fromisoformat(self.min_date)).days
+
+
+@dataclass
+class StatisticsCatalog:
+    """Person and event statistics of one OMOP extract."""
+    persons: int = 0
+    gender_counts: Dict[int, int] = field(default_factory=dict)  # gender_concept_id -> persons
+    birth_year_counts: Dict[int, int] = field(default_factory=dict)  # year_of_birth -> persons
+    domains: Dict[str, DomainStats] = field(default_factory=dict)  # event_type -> stats
+
+    # ----------------- Build from a local extract -----------------
+    @classmethod
+    def build(cls, source: Source) -> "StatisticsCatalog":
+        """Scan a local OMOP extract once and collect all statistics."""
+        con = connect(source)
+        try:
+            tables = available_tables(con)
+            if "person" not in tables:
+                raise ValueError(f"OMOP source {source!s} has no person table.")
+            cat = cls(persons=int(con.execute("SELECT count(*) FROM person").fetchone()[0]))
+            cat.gender_counts = {
+                int(g): int(n) for g, n in con.execute(
+                    "SELECT gender_concept_id, count(*) FROM person "
+                    "WHERE gender_concept_id IS NOT NULL GROUP BY 1"
+                ).fetchall()
+            }
+            cat.birth_year_counts = {
+                int(y): int(n) for y, n in con.execute(
+                    "SELECT year_of_birth, count(*) FROM person "
+                    "WHERE year_of_birth IS NOT NULL GROUP BY 1"
+                ).fetchall()
+            }
+            for event_type, (concept_col, date_col) in DOMAIN_TABLES.items():
+                if event_type in tables:
+                    cat.domains[event_type] = cls._build_domain(con, event_type, concept_col, date_col)
+            return cat
+        finally:
+            con.close()
+
+    @staticmethod
+    def _build_domain(con, table: str, concept_col: str, date_col: str) -> DomainStats:
+        ds = DomainStats()
+        persons, min_d, max_d = con.execute(
+            f"SELECT count(DISTINCT person_id), min({date_col}), max({date_col}) FROM {table}"
+        ).fetchone()
+        ds.persons = int(persons or 0)
+        ds.min_date = str(min_d)[:10] if min_d is not None else None
+        ds.max_date = str(max_d)[:10] if max_d is not None else None
+        # One pass over (person, concept) pairs yields both histograms
+        con.execute(
+            f"CREATE OR REPLACE TEMP TABLE _pc AS "
+            f"SELECT {concept_col} AS concept_id, count(*) AS n FROM {table} "
+            f"WHERE {concept_col} IS NOT NULL GROUP BY person_id, {concept_col}"
+        )
+        ds.concept_persons = {
+            int(c): int(n) for c, n in con.execute(
+                "SELECT concept_id, count(*) FROM _pc GROUP BY 1"
+            ).fetchall()
+        }
+        ds.event_counts = {
+            int(k): int(n) for k, n in con.execute(
+                f"SELECT least(n, {EVENT_COUNT_CAP}), count(*) FROM _pc GROUP BY 1"
+            ).fetchall()
+        }
+        con.execute("DROP TABLE _pc")
+        return ds
+
+    # ----------------- JSON persistence -----------------
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "persons": self.persons,
+            "gender_counts": {str(k): v for k, v in self.gender_counts.items()},
+            "birth_year_counts": {str(k): v for k, v in self.birth_year_counts.items()},
+            "domains": {
+                name: {
+                    "persons": ds.persons,
+                    "concept_persons": {str(k): v for k, v in ds.concept_persons.items()},
+                    "event_counts": {str(k): v for k, v in ds.event_counts.items()},
+                    "min_date": ds.min_date,
+                    "max_date": ds.max_date,
+                }
+                for name, ds in self.domains.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "StatisticsCatalog":
+        def ints(m: Dict[str, Any]) -> Dict[int, int]:
+            return {int(k): int(v) for k, v in (m or {}).items()}
+
+        return cls(
+            persons=int(d.get("persons", 0)),
+            gender_counts=ints(d.get("gender_counts")),
+            birth_year_counts=ints(d.get("birth_year_counts")),
+            domains={
+                name: DomainStats(
+                    persons=int(ds.get("persons", 0)),
+                    concept_persons=ints(ds.get("concept_persons")),
+                    event_counts=ints(ds.get("event_counts")),
+                    min_date=ds.get("min_date"),
+                    max_date=ds.get("max_date"),
+                )
+                for name, ds in (d.get("domains") or {}).items()
+            },
+        )
+
+    def save(self, path: Union[str, Path]) -> Path:
+        """Save the catalog as JSON."""
+        p = Path(path)
+        p.write_text(json.dumps(self.to_dict()), encoding="utf-8")
+        return p
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "StatisticsCatalog":
+        """Load a catalog previously written by .save()."""
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+# ---------- Estimator ----------
+@dataclass
+class CohortEstimate:
+    """Estimated cohort size; `selectivity` is the estimated share of all persons."""
+    persons: float
+    selectivity: float
+
+
+class CardinalityEstimator:
+    """
+    Combine catalog statistics through a cohort definition tree.
+
+    Independence assumptions (p = share of all persons):
+    - Demographics: gender and birth-year range are independent of each other
+      and of every clinical event.
+    - Event leaf: persons with the concept / all persons; without a concept id,
+      persons with any event in the domain. `event_instance=k` (or -k) keeps
+      the share of (person, concept) pairs with >= |k| events. `offset` does
+      not change membership and is ignored.
+    - Date leaf: p = 1 (always satisfiable on its own).
+    - AND(a, b) = p_a * p_b; OR(a, b) = p_a + p_b - p_a * p_b; NOT(x) = 1 - p_x.
+    - BEFORE(a, b) = p_a * p_b * P(a precedes b). For two events the order is a
+      coin flip (`before_probability`, default 0.5); against a fixed date it is
+      the share of the event domain's date window on the required side. An
+      `interval` [lo, hi] further scales by (hi - lo + 1) / window days.
+    - Top-level temporal groups are ANDed. Exclusion criteria are estimated the
+      same way and removed as an independent overlap: p = p_inc * (1 - p_exc).
+    """
+
+    def __init__(self, catalog: StatisticsCatalog, before_probability: float = 0.5):
+        self.catalog = catalog
+        self.before_probability = float(before_probability)
+        self._cache: Dict[Any, float] = {}
+
+    # ----------------- Public API -----------------
+    def selectivity(self, criteria) -> float:
+        """Estimated share of persons selected by `criteria`."""
+        d = as_criteria_dict(criteria)
+        p = self._section(d.get("inclusion_criteria") or {})
+        exc = d.get("exclusion_criteria")
+        if exc:
+            p *= 1.0 - self._section(exc)
+        return min(max(p, 0.0), 1.0)
+
+    def estimate(self, criteria) -> CohortEstimate:
+        """Estimated number of persons selected by `criteria`."""
+        p = self.selectivity(criteria)
+        return CohortEstimate(persons=p * self.catalog.persons, selectivity=p)
+
+    def estimate_many(self, criteria_list: Iterable[Any]) -> List[CohortEstimate]:
+        """Estimate a batch; shared sub-trees are computed once via memoization."""
+        return [self.estimate(c) for c in criteria_list]
+
+    # ----------------- Sections -----------------
+    def _section(self, section: Dict[str, Any]) -> float:
+        p = self.demographics_selectivity(section.get("demographics") or {})
+        for group in section.get("temporal_events") or []:
+            p *= self._node(group)
+        return p
+
+    def demographics_selectivity(self, demo: Dict[str, Any]) -> float:
+        cat = self.catalog
+        if not cat.persons:
+            return 0.0
+        p = 1.0
+        gender = demo.get("gender")
+        if gender:
+            gid = GENDER_CONCEPTS.get(str(gender).lower())
+            p *= cat.gender_counts.get(gid, 0) / cat.persons if gid is not None else 0.0
+        lo, hi = demo.get("min_birth_year"), demo.get("max_birth_year")
+        if lo is not None or hi is not None:
+            lo = int(lo) if lo is not None else -10 ** 9
+            hi = int(hi) if hi is not None else 10 ** 9
+            n = sum(c for y, c in cat.birth_year_counts.items() if lo <= y <= hi)
+            p *= n / cat.persons
+        return p
+
+    # ----------------- Tree nodes -----------------
+    def _node(self, node: Dict[str, Any]) -> float:
+        key = freeze_node(node)
+        hit = self._cache.get(key)
+        if hit is None:
+            hit = self._cache[key] = self._compute(node)
+        return hit
+
+    def _compute(self, node: Dict[str, Any]) -> float:
+        op = node.get("operator")
+        if op is None:
+            return self._leaf(node)
+        events = node.get("events") or []
+        op = str(op).upper()
+        ps = [self._node(e) for e in events]
+        if op == "AND":
+            p = 1.0
+            for x in ps:
+                p *= x
+            return p
+        if op == "OR":
+            q = 1.0
+            for x in ps:
+                q *= 1.0 - x
+            return 1.0 - q
+        if op == "NOT":
+            return 1.0 - (ps[0] if ps else 0.0)
+        if op in ("BEFORE", "AFTER"):
+            if len(events) != 2:
+                raise ValueError(f"Operator {op!r} requires exactly 2 event(s), got {len(events)}.")
+            first, second = (events if op == "BEFORE" else events[::-1])
+            return ps[0] * ps[1] * self._order_probability(first, second, node.get("interval"))
+        raise ValueError(f"Unsupported operator: {op!r}")
+
+    def _leaf(self, ev: Dict[str, Any]) -> float:
+        event_type = str(ev.get("event_type", ""))
+        if event_type == "date":
+            return 1.0
+        cat = self.catalog
+        ds = cat.domains.get(event_type)
+        if ds is None or not cat.persons:
+            return 0.0
+        cid = ev.get("event_concept_id")
+        persons = ds.concept_persons.get(int(cid), 0) if cid is not None else ds.persons
+        p = persons / cat.persons
+        k = ev.get("event_instance")
+        if k is not None and abs(int(k)) > 1:
+            p *= ds.at_least_fraction(int(k))
+        return p
+
+    def _order_probability(self, first: Dict[str, Any], second: Dict[str, Any], interval) -> float:
+        p = self.before_probability
+        window: Optional[int] = None
+        if first.get("event_type") == "date" and "operator" not in second:
+            ds = self.catalog.domains.get(str(second.get("event_type")))
+            if ds is not None:
+                p, window = ds.share_after(first["timestamp"]), ds.window_days()
+        elif second.get("event_type") == "date" and "operator" not in first:
+            ds = self.catalog.domains.get(str(first.get("event_type")))
+            if ds is not None:
+                p, window = 1.0 - ds.share_after(second["timestamp"]), ds.window_days()
+        else:
+            windows = [ds.window_days() for ds in self.catalog.domains.values()]
+            windows = [w for w in windows if w]
+            window = max(windows) if windows else None
+        if interval and window:
+            lo, hi = int(interval[0]), int(interval[1])
+            p *= min(max(hi - lo + 1, 0) / window, 1.0)
+        return p
+
+
+def estimate_cohort_sizes(catalog: Union[StatisticsCatalog, str, Path],
+                          criteria_list: Iterable[Any]) -> List[Tuple[Any, CohortEstimate]]:
+    """Convenience: estimate a batch and return (criteria, estimate) pairs, largest first."""
+    if not isinstance(catalog, StatisticsCatalog):
+        catalog = StatisticsCatalog.load(catalog)
+    items = list(criteria_list)
+    estimates = CardinalityEstimator(catalog).estimate_many(items)
+    return sorted(zip(items, estimates), key=lambda t: t[1].persons, reverse=True)
@@ -0,0 +1,344 @@
+# synthetic.py
+"""
+Deterministic synthetic OMOP data for local load testing.
+
+    from CohortDefinition.synthetic import generate_omop
+    generate_omop("synthetic.duckdb", persons=1_000_000, seed=7)   # DuckDB file
+    generate_omop("synthetic_parquet/", persons=100_000)            # Parquet directory
+
+The output is readable by every local-data tool in this package
+(CohortDefinition.omop.connect). The same seed and arguments always produce
+the same rows.
+
+Realism, in brief:
+- person: gender ~ 45/55 male/female, birth years from a mixture around
+  1950 and 1985 (1920-2020), race and ethnicity concepts.
+- Events per person and domain are over-dispersed (gamma-Poisson), so a few
+  persons carry many events, as in claims data.
+- Concept frequencies follow a Zipf law per domain. The head of each
+  distribution is the concepts the package already knows about (the
+  ohdsi_to_snomed_map.csv codes and every event_concept_id in the example
+  YAMLs, shipped as data/seed_concepts.csv), so the shipped examples select
+  non-trivial cohorts; synthetic ids
+  (>= 2,000,000,000) form the long tail.
+- Each person has a few "personal" concepts that recur, giving realistic
+  event_instance counts (chronic conditions, repeat prescriptions).
+- Event dates fall inside a per-person observation period that starts no
+  earlier than birth.
+
+Generation is vectorized with NumPy and loading is done by DuckDB straight
+from the arrays (`pip install numpy duckdb`).
+"""
+
+import csv
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import yaml
+
+from CohortDefinition.events import _SNOMED_MAP_FILE
+from CohortDefinition.omop import DOMAIN_TABLES, GENDER_CONCEPTS, require_duckdb, require_numpy
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+# Concept references of the repository's example / notebook YAMLs, shipped as
+# package data so installed copies seed the same vocabulary (see _write_seed_file)
+_SEED_FILE = Path(__file__).resolve().parent / "data" / "seed_concepts.csv"
+
+# First synthetic (tail) concept id; well above real OMOP standard concepts
+SYNTHETIC_CONCEPT_BASE = 2_000_000_000
+
+_EPOCH_SQL = "DATE '1970-01-01'"
+
+# Real visit concepts and their approximate share of visits
+_VISIT_CONCEPTS = [(9202, 0.62), (581477, 0.15), (9203, 0.12), (9201, 0.08), (262, 0.03)]
+
+_RACE_CONCEPTS = [(8527, 0.72), (8516, 0.13), (8515, 0.06), (0, 0.09)]
+_ETHNICITY_CONCEPTS = [(38003564, 0.82), (38003563, 0.18)]
+
+
+@dataclass
+class SyntheticConfig:
+    """Knobs for generate_omop(); defaults give ~33 events per person."""
+    persons: int = 10_000
+    seed: int = 0
+    # mean events per person, per domain (event_type -> mean)
+    events_per_person: Dict[str, float] = field(default_factory=lambda: {
+        "condition_occurrence": 8.0,
+        "drug_exposure": 6.0,
+        "procedure_occurrence": 4.0,
+        "measurement": 10.0,
+        "visit_occurrence": 5.0,
+    })
+    concepts_per_domain: int = 2_000  # vocabulary size per domain (seed + synthetic tail)
+    zipf_exponent: float = 1.1
+    personal_concepts: int = 3  # recurring concepts per person and domain
+    personal_share: float = 0.4  # share of a person's events drawn from their personal concepts
+    dispersion: float = 1.5  # gamma shape of the per-person event rate (lower = more skew)
+    start_date: str = "2010-01-01"
+    end_date: str = "2022-12-31"
+
+
+# ---------- Seed concepts ----------
+def _walk_events(node: Any) -> Iterable[Dict[str, Any]]:
+    if isinstance(node, dict):
+        if "event_type" in node:
+            yield node
+        for v in node.values():
+            yield from _walk_events(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _walk_events(v)
+
+
+def seed_concepts(yaml_paths: Optional[Sequence[Union[str, Path]]] = None) -> Dict[str, List[int]]:
+    """
+    Known concept ids per domain, most frequently referenced first.
+
+    Sources: the package mapping CSV (condition codes) and every cohort YAML
+    under `yaml_paths`; by default, the references of the repository's example
+    and notebook YAMLs shipped in data/seed_concepts.csv.
+    """
+    counts: Dict[str, Dict[int, int]] = {d: {} for d in DOMAIN_TABLES}
+    if _SNOMED_MAP_FILE.exists():
+        with open(_SNOMED_MAP_FILE, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    cid = int(row["snomed_code"])
+                except (KeyError, ValueError):
+                    continue
+                bucket = counts["condition_occurrence"]
+                bucket[cid] = bucket.get(cid, 0) + 1
+
+    if yaml_paths is None:
+        references = _read_seed_file()
+    else:
+        references = _yaml_references(yaml_paths)
+    for (domain, cid), n in references.items():
+        if domain in counts:
+            counts[domain][cid] = counts[domain].get(cid, 0) + n
+
+    for cid, _ in _VISIT_CONCEPTS:
+        counts["visit_occurrence"].setdefault(cid, 0)
+    return {
+        d: [cid for cid, _ in sorted(c.items(), key=lambda kv: (-kv[1], kv[0]))]
+        for d, c in counts.items()
+    }
+
+
+def _yaml_references(yaml_paths: Sequence[Union[str, Path]]) -> Dict[Tuple[str, int], int]:
+    """(domain, concept id) -> number of references in the cohort YAMLs under `yaml_paths`."""
+    refs: Dict[Tuple[str, int], int] = {}
+    files: List[Path] = []
+    for p in map(Path, yaml_paths):
+        files.extend(sorted(p.rglob("*.yaml")) if p.is_dir() else [p])
+    for path in files:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError):
+            continue
+        for ev in _walk_events(doc):
+            domain, cid = str(ev.get("event_type")), ev.get("event_concept_id")
+            if isinstance(cid, int):
+                refs[(domain, cid)] = refs.get((domain, cid), 0) + 1
+    return refs
+
+
+def _read_seed_file() -> Dict[Tuple[str, int], int]:
+    refs: Dict[Tuple[str, int], int] = {}
+    if _SEED_FILE.exists():
+        with open(_SEED_FILE, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                refs[(row["domain"], int(row["concept_id"]))] = int(row["references"])
+    return refs
+
+
+def _write_seed_file() -> Path:
+    """Maintainers: regenerate data/seed_concepts.csv from a repository checkout."""
+    refs = _yaml_references([_REPO_ROOT / "examples", _REPO_ROOT / "JypterNotebook"])
+    with open(_SEED_FILE, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["domain", "concept_id", "references"])
+        for (domain, cid), n in sorted(refs.items()):
+            writer.writerow([domain, cid, n])
+    return _SEED_FILE
+
+
+# ---------- Generation ----------
+def _vocabulary(np, domain_index: int, seeds: List[int], size: int):
+    """Concept ids for one domain ordered by popularity rank."""
+    size = max(size, len(seeds))
+    tail = SYNTHETIC_CONCEPT_BASE + domain_index * 10_000_000 + np.arange(size - len(seeds), dtype=np.int64)
+    return np.concatenate([np.asarray(seeds, dtype=np.int64), tail])
+
+
+def _categorical(np, rng, pairs, n: int):
+    values = np.array([v for v, _ in pairs], dtype=np.int64)
+    p = np.array([w for _, w in pairs], dtype=np.float64)
+    return values[rng.choice(len(values), size=n, p=p / p.sum())]
+
+
+def _days(np, iso: str) -> int:
+    return int(np.datetime64(iso, "D").astype(np.int64))
+
+
+def generate_person(np, cfg: SyntheticConfig) -> Dict[str, Any]:
+    rng = np.random.default_rng([cfg.seed, 0])
+    n = cfg.persons
+    older = rng.random(n) < 0.45
+    yob = np.where(older, rng.normal(1950, 12, n), rng.normal(1985, 14, n))
+    yob = np.clip(np.rint(yob), 1920, 2020).astype(np.int32)
+    return {
+        "person_id": np.arange(1, n + 1, dtype=np.int64),
+        "gender_concept_id": np.where(
+            rng.random(n) < 0.45, GENDER_CONCEPTS["male"], GENDER_CONCEPTS["female"]
+        ).astype(np.int32),
+        "year_of_birth": yob,
+        "month_of_birth": rng.integers(1, 13, n, dtype=np.int32),
+        "day_of_birth": rng.integers(1, 29, n, dtype=np.int32),
+        "race_concept_id": _categorical(np, rng, _RACE_CONCEPTS, n).astype(np.int32),
+        "ethnicity_concept_id": _categorical(np, rng, _ETHNICITY_CONCEPTS, n).astype(np.int32),
+    }
+
+
+def _observation_periods(np, cfg: SyntheticConfig, yob):
+    """Per-person [start, end] observation window in days since epoch."""
+    rng = np.random.default_rng([cfg.seed, 1])
+    lo, hi = _days(np, cfg.start_date), _days(np, cfg.end_date)
+    birth = ((yob.astype(np.int64) - 1970) * 365.25).astype(np.int64)
+    start = np.maximum(lo + (rng.random(len(yob)) * (hi - lo) * 0.6).astype(np.int64), birth)
+    start = np.minimum(start, hi - 1)
+    length = np.maximum(rng.exponential((hi - lo) * 0.5, len(yob)).astype(np.int64), 30)
+    end = np.minimum(start + length, hi)
+    return start, end
+
+
+def generate_domain(np, cfg: SyntheticConfig, domain: str, seeds: List[int],
+                    obs_start, obs_end) -> Dict[str, Any]:
+    """Vectorized event rows for one domain table."""
+    domain_index = list(DOMAIN_TABLES).index(domain)
+    rng = np.random.default_rng([cfg.seed, 100 + domain_index])
+    n = cfg.persons
+    mean = float(cfg.events_per_person.get(domain, 0.0))
+
+    # Over-dispersed counts: Poisson with a gamma-distributed per-person rate
+    rate = rng.gamma(cfg.dispersion, mean / cfg.dispersion, n) if mean > 0 else np.zeros(n)
+    counts = rng.poisson(rate)
+    total = int(counts.sum())
+    person_idx = np.repeat(np.arange(n, dtype=np.int64), counts)
+
+    if domain == "visit_occurrence":
+        vocab = np.array([c for c, _ in _VISIT_CONCEPTS], dtype=np.int64)
+        weights = np.array([w for _, w in _VISIT_CONCEPTS], dtype=np.float64)
+    else:
+        vocab = _vocabulary(np, domain_index, seeds, cfg.concepts_per_domain)
+        weights = 1.0 / np.arange(1, len(vocab) + 1, dtype=np.float64) ** cfg.zipf_exponent
+    weights /= weights.sum()
+
+    # Global Zipf draw, replaced by a personal recurring concept for a share of events
+    concept_rank = rng.choice(len(vocab), size=total, p=weights)
+    k = max(int(cfg.personal_concepts), 1)
+    personal = rng.choice(len(vocab), size=(n, k), p=weights)
+    use_personal = rng.random(total) < cfg.personal_share
+    pick = rng.integers(0, k, total)
+    concept_rank = np.where(use_personal, personal[person_idx, pick], concept_rank)
+    concept = vocab[concept_rank]
+
+    span = (obs_end - obs_start)[person_idx]
+    start = obs_start[person_idx] + (rng.random(total) * (span + 1)).astype(np.int64)
+
+    # Sort by person then date: the layout real extracts usually have
+    # (rows are already grouped by person, so a stable sort on one packed key is near-linear)
+    key = (person_idx << 20) | (start - obs_start.min())
+    order = np.argsort(key, kind="stable")
+    person_idx, start, concept = person_idx[order], start[order], concept[order]
+
+    concept_col, date_col = DOMAIN_TABLES[domain]
+    cols: Dict[str, Any] = {
+        f"{domain}_id": np.arange(1, total + 1, dtype=np.int64),
+        "person_id": person_idx + 1,
+        concept_col: concept,
+        date_col: start.astype(np.int32),
+    }
+    if domain == "condition_occurrence":
+        cols["condition_end_date"] = (start + rng.integers(0, 60, total)).astype(np.int32)
+    elif domain == "drug_exposure":
+        supply = rng.choice(np.array([7, 30, 90], dtype=np.int64), size=total, p=[0.2, 0.6, 0.2])
+        cols["drug_exposure_end_date"] = (start + supply).astype(np.int32)
+        cols["days_supply"] = supply.astype(np.int32)
+    elif domain == "visit_occurrence":
+        stay = np.where(np.isin(concept, [9201, 262]), rng.integers(1, 15, total), 0)
+        cols["visit_end_date"] = (start + stay).astype(np.int32)
+    elif domain == "measurement":
+        cols["value_as_number"] = np.round(rng.lognormal(3.0, 0.8, total), 2)
+    return cols
+
+
+# ---------- Writing ----------
+_DATE_COLUMNS = {
+    "condition_start_date", "condition_end_date", "drug_exposure_start_date",
+    "drug_exposure_end_date", "procedure_date", "measurement_date",
+    "visit_start_date", "visit_end_date",
+}
+
+
+def _select_sql(cols: Dict[str, Any]) -> str:
+    parts = [
+        f"{_EPOCH_SQL} + {c} AS {c}" if c in _DATE_COLUMNS else c
+        for c in cols
+    ]
+    return "SELECT " + ", ".join(parts) + " FROM _src"
+
+
+def generate_omop(out: Union[str, Path], persons: Optional[int] = None, seed: Optional[int] = None,
+                  format: Optional[str] = None,
+                  config: Optional[SyntheticConfig] = None,
+                  yaml_paths: Optional[Sequence[Union[str, Path]]] = None) -> Dict[str, int]:
+    """
+    Write a synthetic OMOP extract and return row counts per table.
+
+    `format` is "duckdb" or "parquet"; by default a path ending in .duckdb/.db
+    gives a DuckDB file and anything else a Parquet directory. `persons` and
+    `seed` (default: those of `config`, or of SyntheticConfig()) override `config`.
+    """
+    np = require_numpy()
+    duckdb = require_duckdb()
+    overrides = {k: v for k, v in (("persons", persons), ("seed", seed)) if v is not None}
+    cfg = replace(config or SyntheticConfig(), **overrides)
+    out = Path(out)
+    fmt = (format or ("duckdb" if out.suffix in (".duckdb", ".db") else "parquet")).lower()
+    if fmt not in ("duckdb", "parquet"):
+        raise ValueError(f"Unsupported format={format!r}. Use 'duckdb' or 'parquet'.")
+
+    seeds = seed_concepts(yaml_paths)
+    person = generate_person(np, cfg)
+    obs_start, obs_end = _observation_periods(np, cfg, person["year_of_birth"])
+
+    if fmt == "duckdb":
+        out.parent.mkdir(parents=True, exist_ok=True)
+        con = duckdb.connect(str(out))
+    else:
+        out.mkdir(parents=True, exist_ok=True)
+        con = duckdb.connect()
+
+    counts: Dict[str, int] = {}
+
+    def write(name: str, cols: Dict[str, Any]) -> None:
+        con.register("_src", cols)
+        if fmt == "duckdb":
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS {_select_sql(cols)}")
+        else:
+            target = (out / f"{name}.parquet").as_posix()
+            con.execute(f"COPY ({_select_sql(cols)}) TO '{target}' (FORMAT PARQUET)")
+        con.unregister("_src")
+        counts[name] = int(len(next(iter(cols.values()))))
+
+    try:
+        write("person", person)
+        # One domain at a time keeps peak memory to a single table's arrays
+        for domain in DOMAIN_TABLES:
+            write(domain, generate_domain(np, cfg, domain, seeds.get(domain, []), obs_start, obs_end))
+    finally:
+        con.close()
+    return counts
@@ -0,0 +1,508 @@
+# timeline.py
+"""
+Columnar, memory-mapped per-person event timelines for repeated cohort evaluation.
+
+Build the store once from a local OMOP extract, then evaluate any number of
+definitions against it without rescanning the event tables:
+
+    store = TimelineStore.build("synpuf_100k_omop_54.duckdb", "synpuf.timeline")
+    store = TimelineStore.open("synpuf.timeline")     # later runs: mmap, instant
+    store.cohort(cohort)                              # sorted person_id array
+    store.count_many([baseline, study1, study2])      # shared sub-trees evaluated once
+    store.append("synpuf_100k_omop_54.duckdb")        # pick up rows added since the build
+    store.timeline(42)                                # one person's events per domain
+
+Layout (one directory): manifest.json plus one sub-directory per segment. A
+segment holds, per domain, NumPy columns sorted by (person_id, date, concept):
+    <domain>.person_id / .date (int32 days since 1970-01-01) / .concept
+    <domain>.persons + .offsets          per-person contiguous row slices
+    <domain>.concept_keys + .concept_offsets + .concept_rows
+                                         concept id -> its rows, still in (person, date) order
+and the person table (person_id, gender_concept_id, year_of_birth). The build
+writes one segment; every append() adds one with the rows whose
+<table>_id is above the previous watermark (and persons not seen yet);
+compact() merges them back into one.
+
+Cohorts are evaluated with exactly the semantics of sql.py (see its docstring),
+vectorized over those columns: a leaf is a slice of the concept index,
+`event_instance` picks the k-th row of each person's run, BEFORE is a binary
+search within each person's rows ordered by end date.
+Requires: pip install numpy (and duckdb to build or append).
+"""
+
+import json
+import os
+import shutil
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from CohortDefinition.builder import as_criteria_dict, freeze_node
+from CohortDefinition.omop import (
+    DOMAIN_TABLES, GENDER_CONCEPTS, Source, available_tables, connect, require_numpy,
+)
+from CohortDefinition.sql import _UNSUPPORTED_EVENT_FIELDS
+
+STORE_VERSION = 1
+MANIFEST = "manifest.json"
+_NO_YEAR = -(2 ** 31)  # year_of_birth placeholder for NULL
+_NO_CONCEPT = -1  # concept id placeholder for NULL
+_EPOCH = date(1970, 1, 1)
+_DAY_BIAS = 2 ** 31  # makes (shifted) day numbers non-negative inside BEFORE search keys
+
+_EVENT_COLUMNS = ("person_id", "date", "concept")
+_INDEX_COLUMNS = ("persons", "offsets", "concept_keys", "concept_offsets", "concept_rows")
+_PERSON_COLUMNS = ("person_id", "gender_concept_id", "year_of_birth")
+
+
+def _day(value: Any) -> int:
+    """Days since 1970-01-01 for an ISO date (or date-like) value."""
+    return (date.fromisoformat(str(value)[:10]) - _EPOCH).days
+
+
+# ---------- Segment writing ----------
+def _fetch_domain(np, con, table: str, concept_col: str, date_col: str,
+                  watermark: Optional[int]) -> Tuple[Dict[str, Any], Optional[int]]:
+    id_col = f"{table}_id"
+    columns = {r[0] for r in con.execute(f"DESCRIBE {table}").fetchall()}
+    where = f"person_id IS NOT NULL AND {date_col} IS NOT NULL"
+    new_mark = None
+    if id_col in columns:
+        if watermark is not None:
+            where += f" AND {id_col} > {int(watermark)}"
+        new_mark = con.execute(f"SELECT max({id_col}) FROM {table}").fetchone()[0]
+    cols = con.execute(
+        f"SELECT person_id::BIGINT AS person_id, "
+        f"date_diff('day', DATE '1970-01-01', {date_col})::INTEGER AS date, "
+        f"coalesce({concept_col}, {_NO_CONCEPT})::BIGINT AS concept "
+        f"FROM {table} WHERE {where} ORDER BY 1, 2, 3"
+    ).fetchnumpy()
+    arrays = {c: np.ascontiguousarray(cols[c]) for c in _EVENT_COLUMNS}
+    return arrays, (None if new_mark is None else int(new_mark))
+
+
+def _domain_index(np, arrays: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-person slices and the concept index for columns sorted by (person, date, concept)."""
+    persons, counts = np.unique(arrays["person_id"], return_counts=True)
+    order = np.argsort(arrays["concept"], kind="stable")
+    keys, starts = np.unique(arrays["concept"][order], return_index=True)
+    n = len(order)
+    row_type = np.int32 if n < 2 ** 31 else np.int64
+    return {
+        "persons": persons,
+        "offsets": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        "concept_keys": keys,
+        "concept_offsets": np.concatenate((starts, [n])).astype(np.int64),
+        "concept_rows": order.astype(row_type),
+    }
+
+
+def _write_segment(np, seg_dir: Path, person: Dict[str, Any],
+                   domains: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    seg_dir.mkdir(parents=True, exist_ok=True)
+    for c in _PERSON_COLUMNS:
+        np.save(seg_dir / f"person.{c}.npy", person[c])
+    rows = {}
+    for event_type, arrays in domains.items():
+        arrays = {**arrays, **_domain_index(np, arrays)}
+        for c in _EVENT_COLUMNS + _INDEX_COLUMNS:
+            np.save(seg_dir / f"{event_type}.{c}.npy", arrays[c])
+        rows[event_type] = int(len(arrays["date"]))
+    return {"name": seg_dir.name, "persons": int(len(person["person_id"])), "rows": rows}
+
+
+# ---------- Segment reading ----------
+class _Segment:
+    """Memory-mapped arrays of one segment."""
+
+    def __init__(self, np, seg_dir: Path, meta: Dict[str, Any]):
+        self.np = np
+        self.name = meta["name"]
+        load = lambda f: np.load(seg_dir / f"{f}.npy", mmap_mode="r")  # noqa: E731
+        self.person = {c: load(f"person.{c}") for c in _PERSON_COLUMNS}
+        self.domains = {
+            event_type: {c: load(f"{event_type}.{c}") for c in _EVENT_COLUMNS + _INDEX_COLUMNS}
+            for event_type in meta["rows"]
+        }
+
+    def rows(self, event_type: str, concept: Optional[int]):
+        """(person_id, date) rows of a domain, optionally one concept, in (person, date) order."""
+        np = self.np
+        d = self.domains.get(event_type)
+        if d is None:
+            return np.zeros(0, np.int64), np.zeros(0, np.int32)
+        if concept is None:
+            return d["person_id"], d["date"]
+        keys = d["concept_keys"]
+        i = int(np.searchsorted(keys, concept))
+        if i == len(keys) or keys[i] != concept:
+            return np.zeros(0, np.int64), np.zeros(0, np.int32)
+        rows = d["concept_rows"][d["concept_offsets"][i]:d["concept_offsets"][i + 1]]
+        return d["person_id"][rows], d["date"][rows]
+
+
+# ---------- Store ----------
+class TimelineStore:
+    """A built timeline store directory; see the module docstring."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.np = require_numpy()
+        self.path = Path(path)
+        manifest = json.loads((self.path / MANIFEST).read_text(encoding="utf-8"))
+        if manifest.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported timeline store version {manifest.get('version')!r} in {self.path}.")
+        self.manifest = manifest
+        self.segments = [_Segment(self.np, self.path / m["name"], m) for m in manifest["segments"]]
+        np = self.np
+        ids = np.concatenate([s.person["person_id"] for s in self.segments])
+        order = np.argsort(ids, kind="stable")
+        self.person_id = ids[order]
+        self.gender = np.concatenate([s.person["gender_concept_id"] for s in self.segments])[order]
+        self.year_of_birth = np.concatenate([s.person["year_of_birth"] for s in self.segments])[order]
+
+    # ----------------- Build / open / maintain -----------------
+    @classmethod
+    def build(cls, source: Source, path: Union[str, Path], overwrite: bool = False) -> "TimelineStore":
+        """Scan a local OMOP extract once and write a new store at `path`."""
+        path = Path(path)
+        if path.exists():
+            if not overwrite:
+                raise FileExistsError(f"{path} exists; pass overwrite=True to rebuild it.")
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+        manifest = {"version": STORE_VERSION, "segments": [], "watermarks": {}}
+        cls._add_segment(require_numpy(), source, path, manifest, known_persons=None)
+        return cls(path)
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "TimelineStore":
+        return cls(path)
+
+    def append(self, source: Source) -> int:
+        """
+        Add the rows of `source` that arrived since the last build/append.
+
+        Event rows are selected by their <table>_id above the stored watermark
+        (all rows for tables without one, e.g. a delta extract); persons already
+        in the store are skipped. Returns the number of event rows appended.
+        """
+        manifest = json.loads((self.path / MANIFEST).read_text(encoding="utf-8"))
+        meta = self._add_segment(self.np, source, self.path, manifest, known_persons=self.person_id)
+        self.__init__(self.path)
+        return sum(meta["rows"].values())
+
+    def compact(self) -> None:
+        """Merge all segments into one (re-sorting every domain)."""
+        if len(self.segments) <= 1:
+            return
+        np = self.np
+        person = {c: np.concatenate([s.person[c] for s in self.segments]) for c in _PERSON_COLUMNS}
+        domains: Dict[str, Dict[str, Any]] = {}
+        for event_type in DOMAIN_TABLES:
+            parts = [s.domains[event_type] for s in self.segments if event_type in s.domains]
+            if not parts:
+                continue
+            cols = {c: np.concatenate([p[c] for p in parts]) for c in _EVENT_COLUMNS}
+            order = np.lexsort((cols["concept"], cols["date"], cols["person_id"]))
+            domains[event_type] = {c: cols[c][order] for c in _EVENT_COLUMNS}
+        manifest = dict(self.manifest)
+        name = f"seg{int(self.manifest['segments'][-1]['name'][3:]) + 1:04d}"
+        manifest["segments"] = [_write_segment(np, self.path / name, person, domains)]
+        old = [m["name"] for m in self.manifest["segments"]]
+        self._write_manifest(self.path, manifest)
+        self.segments = []
+        for n in old:
+            shutil.rmtree(self.path / n, ignore_errors=True)
+        self.__init__(self.path)
+
+    @classmethod
+    def _add_segment(cls, np, source: Source, path: Path, manifest: Dict[str, Any],
+                     known_persons) -> Dict[str, Any]:
+        con = connect(source)
+        try:
+            tables = available_tables(con)
+            if "person" not in tables:
+                raise ValueError(f"OMOP source {source!s} has no person table.")
+            cols = con.execute(
+                f"SELECT person_id::BIGINT AS person_id, "
+                f"coalesce(gender_concept_id, 0)::BIGINT AS gender_concept_id, "
+                f"coalesce(year_of_birth, {_NO_YEAR})::INTEGER AS year_of_birth "
+                f"FROM person WHERE person_id IS NOT NULL ORDER BY 1"
+            ).fetchnumpy()
+            person = {c: np.ascontiguousarray(cols[c]) for c in _PERSON_COLUMNS}
+            if known_persons is not None and len(known_persons):
+                new = ~np.isin(person["person_id"], known_persons)
+                person = {c: a[new] for c, a in person.items()}
+            watermarks = manifest.setdefault("watermarks", {})
+            domains = {}
+            for event_type, (concept_col, date_col) in DOMAIN_TABLES.items():
+                if event_type not in tables:
+                    continue
+                arrays, mark = _fetch_domain(np, con, event_type, concept_col, date_col,
+                                             watermarks.get(event_type))
+                domains[event_type] = arrays
+                if mark is not None:
+                    watermarks[event_type] = mark
+        finally:
+            con.close()
+        segments = manifest.setdefault("segments", [])
+        name = f"seg{(int(segments[-1]['name'][3:]) + 1) if segments else 0:04d}"
+        meta = _write_segment(np, path / name, person, domains)
+        segments.append(meta)
+        cls._write_manifest(path, manifest)
+        return meta
+
+    @staticmethod
+    def _write_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+        tmp = path / (MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, path / MANIFEST)
+
+    # ----------------- Lookups -----------------
+    def timeline(self, person_id: int) -> Dict[str, List[Tuple[str, int]]]:
+        """(ISO date, concept id) events of one person per domain, in date order."""
+        np = self.np
+        out: Dict[str, List[Tuple[str, int]]] = {}
+        for seg in self.segments:
+            for event_type, d in seg.domains.items():
+                i = int(np.searchsorted(d["persons"], person_id))
+                if i == len(d["persons"]) or d["persons"][i] != person_id:
+                    continue
+                lo, hi = int(d["offsets"][i]), int(d["offsets"][i + 1])
+                out.setdefault(event_type, []).extend(
+                    (date.fromordinal(_EPOCH.toordinal() + int(day)).isoformat(), int(c))
+                    for day, c in zip(d["date"][lo:hi], d["concept"][lo:hi])
+                )
+        for events in out.values():
+            events.sort()
+        return out
+
+    # ----------------- Cohort evaluation -----------------
+    def cohort(self, criteria) -> Any:
+        """Sorted person_id array of the cohort."""
+        return _Evaluator(self).cohort(criteria)
+
+    def count(self, criteria) -> int:
+        return int(len(self.cohort(criteria)))
+
+    def cohorts(self, criteria_list: Iterable[Any]) -> List[Any]:
+        """Evaluate a batch; identical sub-trees across definitions are evaluated once."""
+        ev = _Evaluator(self)
+        return [ev.cohort(c) for c in criteria_list]
+
+    def count_many(self, criteria_list: Iterable[Any]) -> List[int]:
+        return [int(len(p)) for p in self.cohorts(criteria_list)]
+
+
+# ---------- Sorted-array set helpers (relations are usually already person-sorted) ----------
+def _sorted(np, a):
+    return a if len(a) < 2 or bool((a[1:] >= a[:-1]).all()) else np.sort(a)
+
+
+def _distinct(np, a):
+    """Sorted distinct values of `a`."""
+    a = _sorted(np, a)
+    if len(a) < 2:
+        return np.asarray(a)
+    return a[np.concatenate(([True], a[1:] != a[:-1]))]
+
+
+def _member(np, a, sorted_set):
+    """Boolean mask: which values of `a` occur in the sorted distinct array `sorted_set`."""
+    if not len(sorted_set):
+        return np.zeros(len(a), dtype=bool)
+    idx = np.minimum(np.searchsorted(sorted_set, a), len(sorted_set) - 1)
+    return sorted_set[idx] == a
+
+
+class _Evaluator:
+    """
+    Vectorized evaluation of sql.py's semantics. A relation is a tuple of
+    person_id (int64), start and end (float64 days; NaN plays SQL NULL, so
+    comparisons with it are false and fmin/fmax skip it like min()/least()).
+    """
+
+    def __init__(self, store: TimelineStore):
+        self.store = store
+        self.np = store.np
+        self._memo: Dict[Any, Tuple[Any, Any, Any]] = {}
+
+    # ----------------- Cohorts & sections -----------------
+    def cohort(self, criteria):
+        d = as_criteria_dict(criteria)
+        persons = self._section(d.get("inclusion_criteria") or {})
+        exc = d.get("exclusion_criteria")
+        if exc:
+            persons = persons[~_member(self.np, persons, self._section(exc))]
+        return persons
+
+    def _section(self, section: Dict[str, Any]):
+        np = self.np
+        st = self.store
+        mask = np.ones(len(st.person_id), dtype=bool)
+        demo = section.get("demographics") or {}
+        gender = demo.get("gender")
+        if gender:
+            gid = GENDER_CONCEPTS.get(str(gender).lower())
+            if gid is None:
+                raise ValueError(f"Unsupported gender {gender!r}; use 'male' or 'female'.")
+            mask &= st.gender == gid
+        if demo.get("min_birth_year") is not None:
+            mask &= (st.year_of_birth >= int(demo["min_birth_year"])) & (st.year_of_birth != _NO_YEAR)
+        if demo.get("max_birth_year") is not None:
+            mask &= (st.year_of_birth <= int(demo["max_birth_year"])) & (st.year_of_birth != _NO_YEAR)
+        persons = st.person_id[mask]
+        for group in section.get("temporal_events") or []:
+            persons = persons[_member(np, persons, _distinct(np, self.node(group)[0]))]
+        return persons
+
+    # ----------------- Nodes -----------------
+    def node(self, node: Dict[str, Any]):
+        key = freeze_node(node)
+        rel = self._memo.get(key)
+        if rel is None:
+            rel = self._memo[key] = self._compute(node)
+        return rel
+
+    def _empty(self):
+        np = self.np
+        return np.zeros(0, np.int64), np.zeros(0), np.zeros(0)
+
+    def _compute(self, node: Dict[str, Any]):
+        np = self.np
+        op = node.get("operator")
+        if op is None:
+            return self._leaf(node)
+        op = str(op).upper()
+        events = node.get("events") or []
+        if op == "OR":
+            rels = [self.node(e) for e in events] or [self._empty()]
+            return tuple(np.concatenate([r[i] for r in rels]) for i in range(3))
+        if op == "AND":
+            parts = [self._per_person(self.node(e)) for e in events]
+            if not parts:
+                return self._empty()
+            p, s, e = parts[0]
+            for q, qs, qe in parts[1:]:
+                keep = _member(np, p, q)
+                p, s, e = p[keep], s[keep], e[keep]
+                j = np.searchsorted(q, p)
+                s, e = np.fmin(s, qs[j]), np.fmax(e, qe[j])
+            return p, s, e
+        if op == "NOT":
+            inner = _distinct(np, self.node(events[0])[0])
+            p = self.store.person_id[~_member(np, self.store.person_id, inner)]
+            nulls = np.full(len(p), np.nan)
+            return p, nulls, nulls.copy()
+        if op in ("BEFORE", "AFTER"):
+            if len(events) != 2:
+                raise ValueError(f"Operator {op!r} requires exactly 2 event(s), got {len(events)}.")
+            first, second = events if op == "BEFORE" else events[::-1]
+            return self._before(first, second, node.get("interval"))
+        raise ValueError(f"Unsupported operator: {op!r}")
+
+    def _per_person(self, rel):
+        """One row per person: earliest start, latest end (NULLs skipped)."""
+        np = self.np
+        p, s, e = rel
+        if not len(p):
+            return rel
+        if not bool((p[1:] >= p[:-1]).all()):
+            order = np.argsort(p, kind="stable")
+            p, s, e = p[order], s[order], e[order]
+        starts = np.concatenate(([0], np.flatnonzero(p[1:] != p[:-1]) + 1))
+        return p[starts], np.fmin.reduceat(s, starts), np.fmax.reduceat(e, starts)
+
+    def _leaf(self, ev: Dict[str, Any]):
+        np = self.np
+        event_type = str(ev.get("event_type", ""))
+        if event_type == "date":
+            d = np.full(len(self.store.person_id), float(_day(ev.get("timestamp"))))
+            return self.store.person_id, d, d.copy()
+        if event_type not in DOMAIN_TABLES:
+            raise ValueError(f"Unsupported event_type: {event_type!r}")
+        for f in _UNSUPPORTED_EVENT_FIELDS:
+            if ev.get(f) is not None:
+                raise ValueError(f"{event_type}: field {f!r} is not supported by the timeline store.")
+        concept = ev.get("event_concept_id")
+        concept = None if concept is None else int(concept)
+        parts = [seg.rows(event_type, concept) for seg in self.store.segments]
+        if len(parts) == 1:
+            p, d = parts[0]
+        else:
+            p = np.concatenate([x[0] for x in parts])
+            d = np.concatenate([x[1] for x in parts])
+            order = np.lexsort((d, p))
+            p, d = p[order], d[order]
+        k = ev.get("event_instance")
+        if k is not None and len(p):
+            # Rows are in (person, date) order: the k-th occurrence is a fixed step
+            # from the start (or end) of each person's run
+            k = int(k) or 1
+            bounds = np.flatnonzero(p[1:] != p[:-1]) + 1
+            first = np.concatenate(([0], bounds))
+            end = np.concatenate((bounds, [len(p)]))
+            idx = first + (k - 1) if k > 0 else end + k
+            ok = (idx >= first) & (idx < end)
+            p, d = p[idx[ok]], d[idx[ok]]
+        d = d.astype(np.float64)
+        if ev.get("offset"):
+            d = d + int(ev["offset"])
+        return np.asarray(p), d, d.copy()
+
+    def _before(self, first: Dict[str, Any], second: Dict[str, Any], interval):
+        np = self.np
+        lo, hi = (int(interval[0]), int(interval[1])) if interval else (None, None)
+        # Fixed dates become filters on the other operand
+        if first.get("event_type") == "date" and second.get("event_type") != "date":
+            p, s, e = self.node(second)
+            diff = s - _day(first.get("timestamp"))
+            keep = diff > 0
+            if interval:
+                keep &= (diff >= lo) & (diff <= hi)
+            return p[keep], s[keep], e[keep]
+        if second.get("event_type") == "date" and first.get("event_type") != "date":
+            p, s, e = self.node(first)
+            diff = _day(second.get("timestamp")) - e
+            keep = diff > 0
+            if interval:
+                keep &= (diff >= lo) & (diff <= hi)
+            return p[keep], s[keep], e[keep]
+
+        pa, sa, ea = self.node(first)
+        pb, sb, eb = self.node(second)
+        keep = ~np.isnan(ea)
+        pa, sa, ea = pa[keep], sa[keep], ea[keep]
+        keep = ~np.isnan(sb)
+        pb, sb, eb = pb[keep], sb[keep], eb[keep]
+        if not len(pa) or not len(pb):
+            return self._empty()
+        # Distinct b rows (the SQL groups by them)
+        order = np.lexsort((eb, sb, pb))
+        pb, sb, eb = pb[order], sb[order], eb[order]
+        new = np.concatenate(([True], (pb[1:] != pb[:-1]) | (sb[1:] != sb[:-1]) | (eb[1:] != eb[:-1])))
+        pb, sb, eb = pb[new], sb[new], eb[new]
+        # a rows ordered by (person, end) under one int64 key; qualifying a rows of
+        # each b row form one contiguous key range: end in [b.start - hi, b.start - max(lo, 1)]
+        persons = _distinct(np, pa)
+        in_a = _member(np, pb, persons)
+        pb, sb, eb = pb[in_a], sb[in_a], eb[in_a]
+        ia = np.searchsorted(persons, pa).astype(np.int64) << 33
+        ib = np.searchsorted(persons, pb).astype(np.int64) << 33
+        key_a = ia + (ea.astype(np.int64) + _DAY_BIAS)
+        order = np.argsort(key_a, kind="stable")
+        key_a, sa = key_a[order], sa[order]
+        start_b = sb.astype(np.int64) + _DAY_BIAS
+        upper = start_b - max(lo if lo is not None else 1, 1)
+        lower = start_b - hi if hi is not None else np.zeros_like(start_b)
+        i = np.searchsorted(key_a, ib + np.clip(lower, 0, None), side="left")
+        j = np.searchsorted(key_a, ib + np.clip(upper, 0, None), side="right")
+        ok = (j > i) & (upper >= 0)
+        if not ok.any():
+            return self._empty()
+        i, j = i[ok], j[ok]
+        # Earliest a start per range: reduceat over interleaved [i, j) pairs
+        bounds = np.empty(2 * len(i), dtype=np.int64)
+        bounds[0::2], bounds[1::2] = i, j
+        start = np.fmin.reduceat(np.concatenate((sa, [np.nan])), bounds)[0::2]
+        return pb[ok], start, eb[ok]
@@ -0,0 +1,31 @@
+"""
+Benchmark: baseline-relative (delta) planning vs running every cohort from scratch.
+
+Uses the notebook's diabetes and COVID baseline/study YAMLs against a synthetic
+local DuckDB fixture (generated once into the system temp dir).
+Requires: pip install duckdb numpy
+"""
+import tempfile
+from pathlib import Path
+
+from CohortDefinition.omop import connect
+from CohortDefinition.planner import compare_with_scratch
+from CohortDefinition.synthetic import generate_omop
+
+ASSETS = Path(__file__).resolve().parent.parent / "JypterNotebook" / "assets" / "cohort_creation" / "extras"
+
+if __name__ == "__main__":
+    # 1. Local fixture (~10M events)
+    fixture = Path(tempfile.gettempdir()) / "cohort_builder_fixture_300k.duckdb"
+    if not fixture.exists():
+        generate_omop(fixture, persons=300_000, seed=0)
+    con = connect(fixture)
+
+    # 2. Baseline + studies, as in the notebooks
+    for example in ("diabetes_example2", "covid_example3"):
+        cohorts = {p.stem.replace("cohort_creation_config_", ""): p for p in sorted((ASSETS / example).glob("*.yaml"))}
+        report = compare_with_scratch(con, cohorts, repeat=3)
+        print(f"===== {example} =====")
+        print(report["plan"])
+        print(f"from scratch: {report['scratch_seconds']:.3f}s  delta plan: {report['planned_seconds']:.3f}s  "
+              f"speedup: {report['speedup']:.1f}x")
@@ -0,0 +1,98 @@
+"""
+Benchmark: pickled size and round-trip time of large CohortCriteria batches.
+
+Compares the compact encoding used by CohortCriteria pickling against
+- the default dataclass state (what pickle shipped before: full Event /
+  TemporalBlock / Demographics dicts, minus the unpicklable temp-file state);
+- the YAML text (str(cohort)) parsed back with yaml.safe_load.
+"""
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from CohortDefinition import CohortCriteria, Demographics
+from CohortDefinition.events import ConditionOccurrence, DrugExposure, Measurement, VisitOccurrence
+from CohortDefinition.logic import AND, OR, BEFORE, NOT
+
+BATCH = 20_000
+REPEAT = 3
+
+
+def make_cohort(rng: random.Random) -> CohortCriteria:
+    def event():
+        kind = rng.randrange(4)
+        cid = rng.randrange(1_000, 5_000_000)
+        if kind == 0:
+            return ConditionOccurrence(event_concept_id=cid, event_instance=rng.choice([None, 1, 2]))
+        if kind == 1:
+            return DrugExposure(event_concept_id=cid)
+        if kind == 2:
+            return Measurement(event_concept_id=cid, offset=rng.choice([None, -30, 30]))
+        return VisitOccurrence(event_concept_id=rng.choice([9201, 9202, 9203]))
+
+    index = event()
+    blocks = [AND(index, OR(event(), event())), BEFORE(event(), index)]
+    exclusion = [NOT(event())] if rng.random() < 0.5 else None
+    return CohortCriteria(
+        temporal_blocks=blocks,
+        demographics=Demographics(gender=rng.choice([None, "male", "female"]),
+                                  min_birth_year=rng.randrange(1930, 1980)),
+        exclusion_blocks=exclusion,
+    )
+
+
+def default_state(c: CohortCriteria) -> dict:
+    return {k: v for k, v in vars(c).items() if not k.startswith("_tmp")}
+
+
+def timed(fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def section_count(c: CohortCriteria) -> int:
+    return len(c.to_dict()["inclusion_criteria"])
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    batch = [make_cohort(rng) for _ in range(BATCH)]
+    for c in batch[:100]:
+        os.fspath(c)  # temp-file state must not break (or bloat) pickling
+
+    # 1. Compact encoding
+    blob, dump_s = timed(lambda: pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL))
+    restored, load_s = timed(lambda: pickle.loads(blob))
+    assert all(str(a) == str(b) for a, b in zip(batch[:500], restored))
+
+    # 2. Default dataclass state
+    states = [default_state(c) for c in batch]
+    legacy, legacy_dump_s = timed(lambda: pickle.dumps(states, protocol=pickle.HIGHEST_PROTOCOL))
+    _, legacy_load_s = timed(lambda: pickle.loads(legacy))
+
+    # 3. YAML text
+    texts, yaml_dump_s = timed(lambda: [str(c) for c in batch[:2_000]])
+    _, yaml_load_s = timed(lambda: [yaml.safe_load(t) for t in texts])
+    scale = BATCH / len(texts)
+
+    print(f"{BATCH} cohorts, best of {REPEAT}")
+    print(f"{'':18}{'bytes/cohort':>14}{'dump (s)':>10}{'load (s)':>10}")
+    print(f"{'compact pickle':18}{len(blob) / BATCH:>14.0f}{dump_s:>10.3f}{load_s:>10.3f}")
+    print(f"{'dataclass state':18}{len(legacy) / BATCH:>14.0f}{legacy_dump_s:>10.3f}{legacy_load_s:>10.3f}")
+    print(f"{'YAML text':18}{sum(map(len, texts)) / len(texts):>14.0f}"
+          f"{yaml_dump_s * scale:>10.3f}{yaml_load_s * scale:>10.3f}  (extrapolated)")
+
+    # 4. Shipping to a process pool end to end
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        t0 = time.perf_counter()
+        sizes = list(pool.map(section_count, batch, chunksize=500))
+        print(f"process pool round trip of {BATCH} cohorts: {time.perf_counter() - t0:.2f}s")
+    assert sizes[:100] == [len(c.to_dict()["inclusion_criteria"]) for c in batch[:100]]
@@ -0,0 +1,36 @@
+"""
+Benchmark: one shared-scan query for a baseline and its studies vs one query per cohort.
+
+Uses the notebook's baseline/study YAMLs (and the example YAMLs as a set of
+unrelated cohorts) against a synthetic local DuckDB fixture (generated once
+into the system temp dir). Both ways must return the same persons.
+Requires: pip install duckdb numpy
+"""
+import tempfile
+from pathlib import Path
+
+from CohortDefinition.omop import connect
+from CohortDefinition.planner import compare_shared_scan
+from CohortDefinition.synthetic import generate_omop
+
+ROOT = Path(__file__).resolve().parent.parent
+ASSETS = ROOT / "JypterNotebook" / "assets" / "cohort_creation" / "extras"
+
+if __name__ == "__main__":
+    # 1. Local fixture (~10M events)
+    fixture = Path(tempfile.gettempdir()) / "cohort_builder_fixture_300k.duckdb"
+    if not fixture.exists():
+        generate_omop(fixture, persons=300_000, seed=0)
+    con = connect(fixture)
+
+    # 2. Cohort sets
+    sets = {example: sorted((ASSETS / example).glob("*.yaml")) for example in
+            ("covid_example3", "diabetes_example2", "heart_failure_example1")}
+    sets["examples"] = sorted((ROOT / "examples").glob("*.yaml"))
+
+    for label, paths in sets.items():
+        report = compare_shared_scan(con, {p.stem.replace("cohort_creation_config_", ""): p for p in paths}, repeat=5)
+        print(f"===== {label} ({len(paths)} cohorts) =====")
+        print(", ".join(f"{n}: {c}" for n, c in report["counts"].items()))
+        print(f"one by one: {report['separate_seconds']:.3f}s  shared scan: {report['shared_seconds']:.3f}s  "
+              f"speedup: {report['speedup']:.1f}x")
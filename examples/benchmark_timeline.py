@@ -0,0 +1,55 @@
+"""
+Benchmark: cohort evaluation on the memory-mapped timeline store vs DuckDB SQL.
+
+Builds the store once from a synthetic local DuckDB fixture (both generated
+into the system temp dir), then evaluates the notebook and example YAMLs both
+ways and checks that the person sets are identical.
+Requires: pip install duckdb numpy
+"""
+import tempfile
+import time
+from pathlib import Path
+
+from CohortDefinition.omop import connect
+from CohortDefinition.sql import compile_cohort
+from CohortDefinition.synthetic import generate_omop
+from CohortDefinition.timeline import TimelineStore
+
+ROOT = Path(__file__).resolve().parent.parent
+YAMLS = sorted((ROOT / "JypterNotebook" / "assets" / "cohort_creation" / "extras").glob("*/*.yaml")) \
+    + sorted((ROOT / "examples").glob("*.yaml"))
+
+if __name__ == "__main__":
+    # 1. Local fixture (~10M events) and its timeline store
+    tmp = Path(tempfile.gettempdir())
+    fixture = tmp / "cohort_builder_fixture_300k.duckdb"
+    if not fixture.exists():
+        generate_omop(fixture, persons=300_000, seed=0)
+    store_path = tmp / "cohort_builder_fixture_300k.timeline"
+    if not store_path.exists():
+        t0 = time.perf_counter()
+        TimelineStore.build(fixture, store_path)
+        print(f"built timeline store in {time.perf_counter() - t0:.2f}s")
+    t0 = time.perf_counter()
+    store = TimelineStore.open(store_path)
+    print(f"opened timeline store in {(time.perf_counter() - t0) * 1000:.1f}ms")
+    con = connect(fixture)
+
+    # 2. Each definition both ways
+    sql_total = store_total = 0.0
+    for path in YAMLS:
+        t0 = time.perf_counter()
+        expected = sorted(r[0] for r in con.execute(compile_cohort(path)).fetchall())
+        sql_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        got = store.cohort(path)
+        store_s = time.perf_counter() - t0
+        assert expected == got.tolist(), path.name
+        sql_total, store_total = sql_total + sql_s, store_total + store_s
+        print(f"{path.name:48} {len(got):>8} persons  duckdb {sql_s:.3f}s  timeline {store_s:.3f}s")
+    print(f"total: duckdb {sql_total:.2f}s  timeline {store_total:.2f}s  speedup {sql_total / store_total:.1f}x")
+
+    # 3. The whole batch at once (shared sub-trees evaluated once)
+    t0 = time.perf_counter()
+    store.count_many(YAMLS)
+    print(f"timeline batch of {len(YAMLS)}: {time.perf_counter() - t0:.2f}s")
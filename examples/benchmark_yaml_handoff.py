@@ -0,0 +1,67 @@
+"""
+Benchmark: handing a CohortCriteria to a consumer, per handoff backing.
+
+A path-only consumer (like `bias.create_cohort`) receives `os.fspath(cohort)`
+and reads the YAML back; the backings compared are the system temp dir (the
+previous behaviour), a tmpfs file in /dev/shm and a Linux memfd. Consumers that
+accept a dict or a stream take `to_dict()` / `yaml_stream()` instead.
+Parsing the YAML back costs the same for every text handoff and is left out;
+the first round trip per backing is checked with yaml.safe_load.
+Set TMPDIR to an NFS mount to see the cost the in-memory backings avoid.
+"""
+import gc
+import os
+import tempfile
+import time
+
+import yaml
+
+from CohortDefinition import CohortCriteria, Demographics, builder
+from CohortDefinition.events import ConditionOccurrence, DrugExposure, VisitOccurrence
+from CohortDefinition.logic import AND, BEFORE
+
+ROUNDS = 2_000
+
+
+def make_cohort(i: int) -> CohortCriteria:
+    index = ConditionOccurrence(event_concept_id=201826 + i)
+    return CohortCriteria(
+        temporal_blocks=[AND(index, VisitOccurrence(event_concept_id=9201)),
+                         BEFORE(index, DrugExposure(event_concept_id=1503297), offset=180)],
+        demographics=Demographics(gender="female", min_birth_year=1950),
+    )
+
+
+def path_consumer(path) -> str:
+    with open(os.fspath(path), encoding="utf-8") as f:
+        return f.read()
+
+
+def timed(fn) -> float:
+    gc.collect()
+    t0 = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(i)
+    return (time.perf_counter() - t0) / ROUNDS * 1e6
+
+
+if __name__ == "__main__":
+    print(f"temp dir: {tempfile.gettempdir()}, {ROUNDS} rounds, microseconds per handoff")
+    print(f"{'':22}{'new cohort':>12}{'reused':>10}")
+    for backing in ("tempfile", "shm", "memfd"):
+        builder.YAML_HANDOFF = backing
+        reused = make_cohort(0)
+        path = os.fspath(reused)
+        assert yaml.safe_load(path_consumer(reused)) == reused.to_dict()
+        if backing != "tempfile" and os.path.dirname(path) == tempfile.gettempdir():
+            print(f"{'path (' + backing + ')':22}unavailable here, fell back to the temp dir")
+            continue
+        new = timed(lambda i: path_consumer(make_cohort(i)))
+        again = timed(lambda i: path_consumer(reused))
+        print(f"{'path (' + backing + ')':22}{new:>12.0f}{again:>10.0f}")
+    builder.YAML_HANDOFF = "auto"
+
+    print(f"{'stream':22}{timed(lambda i: make_cohort(i).yaml_stream().read()):>12.0f}"
+          f"{timed(lambda i: reused.yaml_stream().read()):>10.0f}")
+    print(f"{'dict':22}{timed(lambda i: make_cohort(i).to_dict()):>12.0f}"
+          f"{timed(lambda i: reused.to_dict()):>10.0f}")
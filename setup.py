@@ -6,8 +6,14 @@ setup(
     description="Schema-faithful helpers to build BiasAnalyzer-compatible cohort YAML.",
     author="Shuhan Lu @ VAC Lab",
     packages=find_packages(),
+    # Mapping CSV and seed concepts for synthetic data
+    package_data={"CohortDefinition": ["data/*.csv"]},
     python_requires=">=3.7",
     install_requires=[
         "PyYAML>=5.4",
     ],
+    extras_require={
+        # Local OMOP data tools (statistics catalog, synthetic data, ...)
+        "data": ["duckdb>=0.9", "numpy>=1.17"],
+    },
 )
\ No newline at end of file